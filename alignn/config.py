@@ -176,6 +176,13 @@ class TrainingConfig(BaseSettings):
     target_multiplication_factor: Optional[float] = None
     epochs: int = 300
     batch_size: int = 64
+    # per-batch size budgets; if any is set, train and val batches are
+    # packed up to the budget instead of holding batch_size structures
+    max_batch_nodes: Optional[int] = None
+    max_batch_edges: Optional[int] = None
+    max_batch_triplets: Optional[int] = None
+    # group structures of similar size into the same train and val batches
+    bucket_batching: bool = False
     weight_decay: float = 0
     learning_rate: float = 1e-2
     filename: str = "sample"
@@ -184,6 +191,8 @@ class TrainingConfig(BaseSettings):
     optimizer: Literal["adamw", "sgd"] = "adamw"
     scheduler: Literal["onecycle", "none"] = "onecycle"
     pin_memory: bool = False
+    # reuse a versioned snapshot of the featurized dataset
+    # (<filename>_snapshot), rebuilt when dataset or graph settings change
     save_dataloader: bool = False
     write_checkpoint: bool = True
     write_predictions: bool = True
@@ -193,6 +202,32 @@ class TrainingConfig(BaseSettings):
     standard_scalar_and_pca: bool = False
     use_canonize: bool = True
     num_workers: int = 4
+    # batches moved to the device ahead of time
+    # by a background thread during training (0: synchronous)
+    prefetch_batches: int = 0
+    # fp32, or bf16 autocast of the forward passes in training and
+    # evaluation (norms and gate denominators stay in fp32)
+    precision: Literal["fp32", "bf16"] = "fp32"
+    # process pool size for structure parsing and
+    # crystal graph construction (0: serial)
+    graph_workers: int = 0
+    # directory for the content-addressed graph cache and, with
+    # train_for_folder, the parsed structure cache (None: no caching)
+    cachedir: Optional[str] = None
+    # train_for_folder: stream id_prop.csv in chunks of this many
+    # structures into an on-disk graph store (None: load all at once)
+    ingest_chunk_size: Optional[int] = None
+    # directory for columnar indexes of JARVIS datasets
+    # (None: ~/.cache/alignn/datasets)
+    dataset_index_dir: Optional[str] = None
+    # where featurized graphs live during training
+    # (mmap: memory-mapped on-disk store in output_dir,
+    #  shared: that store copied into shared memory, batches gathered
+    #  from it in the DataLoader workers,
+    #  lazy: built on access in the DataLoader workers)
+    graph_storage: Literal["memory", "mmap", "shared", "lazy"] = "memory"
+    # samples kept per DataLoader worker with lazy graph_storage
+    graph_lru_size: int = 1024
     cutoff: float = 8.0
     max_neighbors: int = 12
     keep_data_order: bool = False
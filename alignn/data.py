@@ -1,23 +1,40 @@
 """Jarvis-dgl data loaders and DGLGraph utilities."""
 
+import csv
+import hashlib
+import json
 import random
+import warnings
+from collections import deque
+from functools import partial
+from multiprocessing import Pool
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 # from typing import Dict, List, Optional, Set, Tuple
 
 import os
 import torch
-import dgl
 import numpy as np
 import pandas as pd
 from jarvis.core.atoms import Atoms
-from jarvis.core.graphs import Graph, StructureDataset
-from jarvis.db.figshare import data as jdata
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Subset
 from tqdm import tqdm
 import math
 from jarvis.db.jsonutils import dumpjson
+from alignn.dataset_index import dataset_index
+from alignn.graph_cache import GraphCache, structure_hash
+from alignn.graph_store import GraphStoreDataset, SharedGraphDataset
+from alignn.graph_store import GraphStore, GraphStoreWriter
+from alignn.graph_store import write_graph_store
+from alignn.graphs import (
+    LazyStructureDataset,
+    StructureDataset,
+    atom_dgl_multigraph,
+    build_line_graph,
+)
+from alignn.samplers import BucketBatchSampler, BudgetBatchSampler
+from alignn.snapshot import load_snapshot, save_snapshot, snapshot_dataset
 
 # from sklearn.pipeline import Pipeline
 import pickle as pk
@@ -34,46 +51,238 @@ def load_dataset(
     target=None,
     limit: Optional[int] = None,
     classification_threshold: Optional[float] = None,
+    columns: Optional[List[str]] = None,
+    index_dir: Optional[str] = None,
 ):
-    """Load jarvis data."""
-    d = jdata(name)
-    data = []
-    for i in d:
-        if i[target] != "na" and not math.isnan(i[target]):
-            if classification_threshold is not None:
-                if i[target] <= classification_threshold:
-                    i[target] = 0
-                elif i[target] > classification_threshold:
-                    i[target] = 1
-                else:
-                    raise ValueError(
-                        "Check classification data type.",
-                        i[target],
-                        type(i[target]),
-                    )
-            data.append(i)
-    d = data
+    """Load jarvis data.
+
+    Records with a valid `target` are read from the local dataset
+    index, holding only `columns` (default: all) and the target.
+    """
+    index = dataset_index(name, index_dir=index_dir)
+    rows, values = index.select_target(
+        target, classification_threshold=classification_threshold
+    )
     if limit is not None:
-        d = d[:limit]
-    d = pd.DataFrame(d)
-    # d = d.replace("na", np.nan)
+        rows, values = rows[:limit], values[:limit]
+    if columns is not None:
+        columns = [k for k in columns if k != target]
+    d = pd.DataFrame(index.records(columns, rows))
+    d[target] = values
     return d
 
 
-# np.mean(mean_absolute_deviation(x,axis=0))
 def mean_absolute_deviation(data, axis=None):
     """Get Mean absolute deviation."""
     return np.mean(np.absolute(data - np.mean(data, axis)), axis)
 
 
+_STRUCTURE_READERS = {
+    "poscar": Atoms.from_poscar,
+    "cif": Atoms.from_cif,
+    # Note using 500 angstrom as box size
+    "xyz": partial(Atoms.from_xyz, box_size=500),
+    # Note using 500 angstrom as box size
+    # Recommended install pytraj
+    # conda install -c ambermd pytraj
+    "pdb": partial(Atoms.from_pdb, max_lat=500),
+}
+
+# bump when the parsed structure cache layout changes
+STRUCTURE_CACHE_VERSION = 1
+
+
+def read_structure(file_path: str, file_format: str = "poscar") -> Atoms:
+    """Read a poscar/cif/xyz/pdb structure file."""
+    if file_format not in _STRUCTURE_READERS:
+        raise NotImplementedError("File format not implemented", file_format)
+    return _STRUCTURE_READERS[file_format](file_path)
+
+
+def read_structures(
+    paths: List[str],
+    file_format: str = "poscar",
+    workers: int = 0,
+    cache_path: Optional[str] = None,
+) -> List[Atoms]:
+    """Parse structure files, optionally in a process pool.
+
+    With a `cache_path`, parsed structures are pickled there and
+    reused while a file's modification time and size are unchanged.
+    """
+    stamps = [(st.st_mtime_ns, st.st_size) for st in map(os.stat, paths)]
+    keys = [os.path.abspath(p) for p in paths]
+    cached = {}
+    if cache_path is not None and os.path.isfile(cache_path):
+        with open(cache_path, "rb") as f:
+            cache = pk.load(f)
+        if cache.get("version") == STRUCTURE_CACHE_VERSION:
+            cached = cache["structures"]
+
+    structures = [None] * len(paths)
+    missing = []
+    for i, (key, stamp) in enumerate(zip(keys, stamps)):
+        entry = cached.get(key)
+        if entry is not None and entry[0] == stamp:
+            structures[i] = entry[1]
+        else:
+            missing.append(i)
+    if cache_path is not None:
+        print("Structure cache:", cache_path)
+        print("Cached structures:", len(paths) - len(missing), end=" ")
+        print("new:", len(missing))
+
+    read = partial(read_structure, file_format=file_format)
+    todo = [paths[i] for i in missing]
+    if workers == 0:
+        for i, atoms in zip(missing, tqdm(map(read, todo), total=len(todo))):
+            structures[i] = atoms
+    else:
+        chunksize = max(1, min(1000, math.ceil(len(todo) / (4 * workers))))
+        with Pool(workers) as pool:
+            parsed = pool.imap(read, todo, chunksize=chunksize)
+            for i, atoms in zip(missing, tqdm(parsed, total=len(todo))):
+                structures[i] = atoms
+
+    if cache_path is not None and missing:
+        cached.update(
+            (key, (stamp, atoms))
+            for key, stamp, atoms in zip(keys, stamps, structures)
+        )
+        cache_dir = os.path.dirname(os.path.abspath(cache_path))
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = cache_path + ".tmp"
+        with open(tmp, "wb") as f:
+            pk.dump(
+                {"version": STRUCTURE_CACHE_VERSION, "structures": cached}, f
+            )
+        os.replace(tmp, cache_path)
+    return structures
+
+
+def atoms_to_graph(
+    atoms, cutoff: float = 8, max_neighbors: int = 12, use_canonize=False
+):
+    """Convert structure (Atoms or dict) to DGLGraph."""
+    structure = atoms
+    if isinstance(atoms, dict):
+        structure = Atoms.from_dict(atoms)
+    return atom_dgl_multigraph(
+        structure,
+        cutoff=cutoff,
+        atom_features="atomic_number",
+        max_neighbors=max_neighbors,
+        compute_line_graph=False,
+        use_canonize=use_canonize,
+    )
+
+
+def _build_graph_chunk(chunk, cache=None, line_graph=False, **graph_params):
+    """Build graphs for a chunk of (key, atoms) pairs.
+
+    If a `cache` is given, crystal graphs and their line graphs
+    are written to it under their structure keys
+    and nothing is sent back to the parent process.
+    """
+    graphs = []
+    for key, atoms in chunk:
+        g = atoms_to_graph(atoms, **graph_params)
+        if cache is not None:
+            cache.save(key, [g, build_line_graph(g)])
+        elif line_graph:
+            graphs.append((g, build_line_graph(g)))
+        else:
+            graphs.append(g)
+    return graphs
+
+
+def _iter_graphs(tasks, graph_workers=0, cache=None, **graph_params):
+    """Build graphs for (key, atoms) pairs, optionally in a process pool.
+
+    Graphs are yielded in the original order. When caching,
+    workers stream finished graphs to the cache
+    instead of pickling them back to the parent.
+    Otherwise at most two chunks per worker are in flight, so the
+    parent only holds the graphs its consumer has not taken yet.
+    """
+    if graph_workers == 0:
+        for task in tqdm(tasks):
+            yield from _build_graph_chunk([task], cache=cache, **graph_params)
+        return
+
+    chunksize = math.ceil(len(tasks) / (4 * graph_workers))
+    chunksize = max(1, min(1000, chunksize))
+    chunks = [
+        tasks[i : i + chunksize]  # noqa:E203
+        for i in range(0, len(tasks), chunksize)
+    ]
+    build = partial(_build_graph_chunk, cache=cache, **graph_params)
+    pending = deque()
+    with Pool(graph_workers) as pool, tqdm(total=len(chunks)) as progress:
+        for chunk in chunks:
+            pending.append(pool.apply_async(build, (chunk,)))
+            if len(pending) < 2 * graph_workers:
+                continue
+            yield from pending.popleft().get()
+            progress.update()
+        while pending:
+            yield from pending.popleft().get()
+            progress.update()
+
+
+def iter_graphs(
+    df: pd.DataFrame,
+    neighbor_strategy: str = "k-nearest",
+    cutoff: float = 8,
+    max_neighbors: int = 12,
+    cachedir: Optional[Path] = None,
+    use_canonize: bool = False,
+    graph_workers: int = 0,
+    line_graph: bool = False,
+):
+    """Construct crystal graphs one structure at a time.
+
+    Yields graphs, or (graph, line graph) pairs with `line_graph`,
+    in the order of `df`; see `load_graphs`.
+    """
+    params = dict(
+        cutoff=cutoff, max_neighbors=max_neighbors, use_canonize=use_canonize
+    )
+    atoms = df["atoms"].tolist()
+    if cachedir is None:
+        tasks = [(None, a) for a in atoms]
+        yield from _iter_graphs(
+            tasks, graph_workers=graph_workers, line_graph=line_graph, **params
+        )
+        return
+
+    cache = GraphCache(cachedir, neighbor_strategy=neighbor_strategy, **params)
+    keys = [structure_hash(a) for a in atoms]
+    missing = {k: a for k, a in zip(keys, atoms) if k not in cache}
+    print("Graph cache:", cache.root)
+    print("Cached graphs:", len(keys) - len(missing), "new:", len(missing))
+    for _ in _iter_graphs(
+        list(missing.items()),
+        graph_workers=graph_workers,
+        cache=cache,
+        **params,
+    ):
+        pass
+    for k in tqdm(keys):
+        graphs = cache.load(k, line_graph=line_graph)
+        yield tuple(graphs) if line_graph else graphs[0]
+
+
 def load_graphs(
     df: pd.DataFrame,
-    name: str = "dft_3d",
+    name: Optional[str] = None,
     neighbor_strategy: str = "k-nearest",
     cutoff: float = 8,
     max_neighbors: int = 12,
     cachedir: Optional[Path] = None,
     use_canonize: bool = False,
+    graph_workers: int = 0,
+    line_graph: bool = False,
 ):
     """Construct crystal graphs.
 
@@ -86,33 +295,129 @@ def load_graphs(
           ndata_schemes={'atom_features': Scheme(shape=(1,)}
           edata_schemes={'r': Scheme(shape=(3,)})
     ```
-    """
 
-    def atoms_to_graph(atoms):
-        """Convert structure dict to DGLGraph."""
-        structure = Atoms.from_dict(atoms)
-        return Graph.atom_dgl_multigraph(
-            structure,
+    `graph_workers` > 0 builds graphs in a process pool of that size.
+    With a `cachedir`, graphs are stored in a content-addressed
+    `GraphCache` and only structures missing from it are built.
+    Cache entries also hold the line graph with bond angle cosines.
+    Workers write finished chunks to the cache; without a `cachedir`
+    they are pickled back to the parent, and as every graph is kept
+    in the returned list, memory grows with the dataset. Use
+    `iter_graphs` (e.g. via a graph store) to stream them instead.
+
+    With `line_graph`, returns (graphs, line_graphs) instead.
+
+    `name` is deprecated and ignored: cached graphs are keyed by
+    structure content and graph parameters, not by dataset name.
+    """
+    if name is not None:
+        warnings.warn(
+            "load_graphs(name=...) is ignored and will be removed",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+    graphs = list(
+        iter_graphs(
+            df,
+            neighbor_strategy=neighbor_strategy,
             cutoff=cutoff,
-            atom_features="atomic_number",
             max_neighbors=max_neighbors,
-            compute_line_graph=False,
+            cachedir=cachedir,
             use_canonize=use_canonize,
+            graph_workers=graph_workers,
+            line_graph=line_graph,
         )
+    )
+    if line_graph:
+        return tuple(map(list, zip(*graphs))) if graphs else ([], [])
+    return graphs
 
-    if cachedir is not None:
-        cachefile = cachedir / f"{name}-{neighbor_strategy}.bin"
-    else:
-        cachefile = None
 
-    if cachefile is not None and cachefile.is_file():
-        graphs, labels = dgl.load_graphs(str(cachefile))
-    else:
-        graphs = df["atoms"].progress_apply(atoms_to_graph).values
-        if cachefile is not None:
-            dgl.save_graphs(str(cachefile), graphs.tolist())
+def ingest_id_prop(
+    root_dir: str,
+    store_path: str,
+    file_format: str = "poscar",
+    chunk_size: int = 10000,
+    id_tag: str = "jid",
+    neighbor_strategy: str = "k-nearest",
+    cutoff: float = 8,
+    max_neighbors: int = 12,
+    cachedir: Optional[Path] = None,
+    use_canonize: bool = False,
+    graph_workers: int = 0,
+    line_graph: bool = True,
+):
+    """Stream the structures of a folder into a graph store.
 
-    return graphs
+    Structures listed in `id_prop.csv` are read `chunk_size` at a time;
+    each chunk is parsed, featurized into the store at `store_path` and
+    released, so peak memory does not grow with the number of structures.
+    As in `get_train_val_loaders`, rows with a NaN scalar target are
+    dropped. A complete store written for the same records and graph
+    parameters is reused; delete it to re-ingest edited structure files.
+
+    Returns the store and the records (id and target) of its graphs.
+    """
+    records = []
+    with open(os.path.join(root_dir, "id_prop.csv"), "r") as f:
+        for row in csv.reader(f):
+            y = [float(j) for j in row[1:]]
+            records.append({id_tag: row[0], "target": y})
+            if len(y) == 1:
+                records[-1]["target"] = y[0]
+    n_rows = len(records)
+    records = [
+        i
+        for i in records
+        if isinstance(i["target"], list) or not math.isnan(i["target"])
+    ]
+    if len(records) < n_rows:
+        print("Dropped rows with NaN targets:", n_rows - len(records))
+
+    params = {
+        "file_format": file_format,
+        "neighbor_strategy": neighbor_strategy,
+        "cutoff": cutoff,
+        "max_neighbors": max_neighbors,
+        "use_canonize": use_canonize,
+        "records": records_hash(records, id_tag=id_tag),
+    }
+    if os.path.exists(os.path.join(store_path, "manifest.json")):
+        store = GraphStore(store_path)
+        if store.manifest["params"] == params and (
+            store.line_graph == line_graph and len(store) == len(records)
+        ):
+            print("Reusing graph store", store_path)
+            return store, records
+        print("Graph store parameters changed, rewriting", store_path)
+
+    with GraphStoreWriter(
+        store_path, line_graph=line_graph, params=params
+    ) as writer:
+        for start in range(0, len(records), chunk_size):
+            chunk = records[start : start + chunk_size]
+            structures = read_structures(
+                [os.path.join(root_dir, i[id_tag]) for i in chunk],
+                file_format=file_format,
+                workers=graph_workers,
+            )
+            graphs = iter_graphs(
+                pd.DataFrame({"atoms": structures}),
+                neighbor_strategy=neighbor_strategy,
+                cutoff=cutoff,
+                max_neighbors=max_neighbors,
+                cachedir=cachedir,
+                use_canonize=use_canonize,
+                graph_workers=graph_workers,
+                line_graph=line_graph,
+            )
+            for x in graphs:
+                if line_graph:
+                    writer.append(*x)
+                else:
+                    writer.append(x)
+            print("Ingested structures:", start + len(chunk))
+    return GraphStore(store_path), records
 
 
 def get_id_train_val_test(
@@ -172,6 +477,53 @@ def get_id_train_val_test(
     return id_train, id_val, id_test
 
 
+def write_data_range(vals, output_dir=".", tmp_name="dataset"):
+    """Write target max and min to a `_data_range` file."""
+    print("data range", np.max(vals), np.min(vals))
+    f = open(os.path.join(output_dir, tmp_name + "_data_range"), "w")
+    line = "Max=" + str(np.max(vals)) + "\n"
+    f.write(line)
+    line = "Min=" + str(np.min(vals)) + "\n"
+    f.write(line)
+    f.close()
+
+
+class StructureSubset(Subset):
+    """Index-based view of one split of a featurized dataset.
+
+    Exposes the dataset attributes used by the training loop,
+    so train, val and test splits can share one featurization.
+    """
+
+    def __init__(self, dataset, indices):
+        """Select `indices` of `dataset`."""
+        super().__init__(dataset, indices)
+        self.ids = dataset.ids.iloc[indices].reset_index(drop=True)
+        self.labels = dataset.labels[indices]
+        self.line_graph = dataset.line_graph
+        self.prepare_batch = dataset.prepare_batch
+        self.collate = dataset.collate
+        self.collate_line_graph = dataset.collate_line_graph
+
+    def graph_sizes(self):
+        """Get (nodes, edges, triplets) counts of the split."""
+        return self.dataset.graph_sizes()[self.indices]
+
+
+def records_hash(records: List[dict], id_tag="jid", target="target"):
+    """Hash the ids, targets and structures of dataset records."""
+    hashes = {
+        "ids": [str(i[id_tag]) for i in records],
+        "targets": [json.dumps(i[target], default=str) for i in records],
+    }
+    if all("atoms" in i for i in records):
+        hashes["structures"] = [structure_hash(i["atoms"]) for i in records]
+    return {
+        k: hashlib.sha1(" ".join(v).encode()).hexdigest()
+        for k, v in hashes.items()
+    }
+
+
 def get_torch_dataset(
     dataset=[],
     id_tag="jid",
@@ -186,27 +538,87 @@ def get_torch_dataset(
     classification=False,
     output_dir=".",
     tmp_name="dataset",
+    graph_workers=0,
+    cachedir=None,
+    graph_storage="memory",
+    graph_lru_size=1024,
 ):
-    """Get Torch Dataset."""
+    """Get Torch Dataset.
+
+    `graph_storage="mmap"` streams graphs into a memory-mapped
+    `GraphStore` in `output_dir` instead of keeping them in memory.
+    `graph_storage="shared"` additionally copies the store into
+    shared memory, gathering batches from it in the DataLoader workers.
+    `graph_storage="lazy"` builds graphs on access in the DataLoader
+    workers, keeping up to `graph_lru_size` samples per worker.
+    `name` is deprecated and ignored, as in `load_graphs`.
+    """
+    if name:
+        warnings.warn(
+            "get_torch_dataset(name=...) is ignored and will be removed",
+            DeprecationWarning,
+            stacklevel=2,
+        )
     df = pd.DataFrame(dataset)
     # print("df", df)
-    vals = df[target].values
-    print("data range", np.max(vals), np.min(vals))
-    f = open(os.path.join(output_dir, tmp_name + "_data_range"), "w")
-    line = "Max=" + str(np.max(vals)) + "\n"
-    f.write(line)
-    line = "Min=" + str(np.min(vals)) + "\n"
-    f.write(line)
-    f.close()
+    write_data_range(df[target].values, output_dir, tmp_name)
 
-    graphs = load_graphs(
-        df,
-        name=name,
+    graph_params = dict(
         neighbor_strategy=neighbor_strategy,
         use_canonize=use_canonize,
         cutoff=cutoff,
         max_neighbors=max_neighbors,
+        graph_workers=graph_workers,
+        cachedir=cachedir,
+        line_graph=bool(line_graph),
     )
+    if graph_storage == "lazy":
+        cache = None
+        if cachedir is not None:
+            cache = GraphCache(
+                cachedir,
+                neighbor_strategy=neighbor_strategy,
+                cutoff=cutoff,
+                max_neighbors=max_neighbors,
+                use_canonize=use_canonize,
+            )
+        return LazyStructureDataset(
+            df,
+            target=target,
+            atom_features=atom_features,
+            line_graph=line_graph,
+            id_tag=id_tag,
+            classification=classification,
+            neighbor_strategy=neighbor_strategy,
+            cutoff=cutoff,
+            max_neighbors=max_neighbors,
+            use_canonize=use_canonize,
+            cache=cache,
+            lru_size=graph_lru_size,
+        )
+    if graph_storage in ("mmap", "shared"):
+        store = write_graph_store(
+            os.path.join(output_dir, tmp_name + "_graphs"),
+            iter_graphs(df, **graph_params),
+            line_graph=bool(line_graph),
+        )
+        store_dataset = GraphStoreDataset
+        if graph_storage == "shared":
+            store_dataset = SharedGraphDataset
+        return store_dataset(
+            df,
+            store,
+            target=target,
+            atom_features=atom_features,
+            line_graph=line_graph,
+            id_tag=id_tag,
+            classification=classification,
+        )
+
+    graphs = load_graphs(df, **graph_params)
+    line_graphs = None
+    if line_graph:
+        graphs, line_graphs = graphs
 
     data = StructureDataset(
         df,
@@ -216,6 +628,7 @@ def get_torch_dataset(
         line_graph=line_graph,
         id_tag=id_tag,
         classification=classification,
+        line_graphs=line_graphs,
     )
     return data
 
@@ -250,52 +663,97 @@ def get_train_val_loaders(
     keep_data_order=False,
     output_features=1,
     output_dir=None,
+    graph_workers: int = 0,
+    cachedir: Optional[str] = None,
+    graph_storage: str = "memory",
+    graph_lru_size: int = 1024,
+    max_batch_nodes: Optional[int] = None,
+    max_batch_edges: Optional[int] = None,
+    max_batch_triplets: Optional[int] = None,
+    bucket_batching: bool = False,
+    dataset_index_dir: Optional[str] = None,
+    graph_store: Optional[GraphStore] = None,
 ):
-    """Help function to set up JARVIS train and val dataloaders."""
-    train_sample = filename + "_train.data"
-    val_sample = filename + "_val.data"
-    test_sample = filename + "_test.data"
+    """Help function to set up JARVIS train and val dataloaders.
+
+    If any of `max_batch_nodes`, `max_batch_edges` or
+    `max_batch_triplets` is set, train and val batches are packed
+    up to that size budget instead of using a fixed `batch_size`.
+    With `bucket_batching`, train and val batches group structures
+    of similar size, in a randomized batch order for training.
+    Named JARVIS datasets are read from a local columnar index
+    in `dataset_index_dir`, built on first use.
+    With a `graph_store` holding the graphs of `dataset_array`
+    (e.g. from `ingest_id_prop`), records need no "atoms".
+    """
     # print ('output_dir data',output_dir)
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    if (
-        os.path.exists(train_sample)
-        and os.path.exists(val_sample)
-        and os.path.exists(test_sample)
-        and save_dataloader
-    ):
-        print("Loading from saved file...")
-        print("Make sure all the DataLoader params are same.")
-        print("This module is made for debugging only.")
-        train_loader = torch.load(train_sample)
-        val_loader = torch.load(val_sample)
-        test_loader = torch.load(test_sample)
-        if train_loader.pin_memory != pin_memory:
-            train_loader.pin_memory = pin_memory
-        if test_loader.pin_memory != pin_memory:
-            test_loader.pin_memory = pin_memory
-        if val_loader.pin_memory != pin_memory:
-            val_loader.pin_memory = pin_memory
-        if train_loader.num_workers != workers:
-            train_loader.num_workers = workers
-        if test_loader.num_workers != workers:
-            test_loader.num_workers = workers
-        if val_loader.num_workers != workers:
-            val_loader.num_workers = workers
-        # print("train", len(train_loader.dataset))
-        # print("val", len(val_loader.dataset))
-        # print("test", len(test_loader.dataset))
-    else:
+    # featurized graphs and targets are snapshotted together and
+    # reused while these parameters are unchanged; the splits are
+    # recomputed from them, so changing a split needs no featurization
+    snapshot_dir = filename + "_snapshot"
+    snapshot_params = dict(
+        dataset=dataset,
+        target=target,
+        id_tag=id_tag,
+        neighbor_strategy=neighbor_strategy,
+        cutoff=cutoff,
+        max_neighbors=max_neighbors,
+        use_canonize=use_canonize,
+        line_graph=bool(line_graph),
+        classification_threshold=classification_threshold,
+        target_multiplication_factor=target_multiplication_factor,
+    )
+    snapshot_kwargs = dict(
+        target=target,
+        atom_features=atom_features,
+        line_graph=line_graph,
+        classification=classification_threshold is not None,
+        id_tag=id_tag,
+        graph_storage=graph_storage,
+    )
+    snapshot = None
+    if save_dataloader and graph_store is None:
+        if dataset_array:
+            snapshot_params.update(
+                records_hash(dataset_array, id_tag=id_tag, target=target)
+            )
+        snapshot = load_snapshot(snapshot_dir, snapshot_params)
 
+    dat = []
+    all_targets = []
+    if snapshot is not None:
+        print("Loading dataset snapshot:", snapshot_dir)
+        # stored targets are already thresholded and scaled
+        for i, y in zip(snapshot["ids"], snapshot["targets"]):
+            dat.append({id_tag: i, target: y})
+            all_targets.append(torch.tensor(y) if isinstance(y, list) else y)
+    else:
         if not dataset_array:
-            d = jdata(dataset)
+            index = dataset_index(dataset, index_dir=dataset_index_dir)
+            d = []
+            if index.kinds.get(target) == "number":
+                # vectorized filtering, reading only the needed columns
+                rows, values = index.select_target(
+                    target,
+                    classification_threshold=classification_threshold,
+                    target_multiplication_factor=(
+                        target_multiplication_factor
+                    ),
+                )
+                all_targets = values.tolist()
+                dat = index.records([id_tag, "atoms"], rows)
+                for i, y in zip(dat, all_targets):
+                    i[target] = y
+            else:
+                d = index.records()
         else:
             d = dataset_array
 
             # for ii, i in enumerate(pc_y):
             #    d[ii][target] = pc_y[ii].tolist()
 
-        dat = []
         if classification_threshold is not None:
             print(
                 "Using ",
@@ -305,7 +763,6 @@ def get_train_val_loaders(
                 " data.",
             )
             print("Converting target data into 1 and 0.")
-        all_targets = []
 
         # TODO:make an all key in qm9_dgl
         if dataset == "qm9_dgl" and target == "all":
@@ -355,177 +812,238 @@ def get_train_val_loaders(
                 dat.append(i)
                 all_targets.append(i[target])
 
-        # id_test = ids[-test_size:]
-        # if standardize:
-        #    data.setup_standardizer(id_train)
-        id_train, id_val, id_test = get_id_train_val_test(
-            total_size=len(dat),
-            split_seed=split_seed,
-            train_ratio=train_ratio,
-            val_ratio=val_ratio,
-            test_ratio=test_ratio,
-            n_train=n_train,
-            n_test=n_test,
-            n_val=n_val,
-            keep_data_order=keep_data_order,
-        )
-        ids_train_val_test = {}
-        ids_train_val_test["id_train"] = [dat[i][id_tag] for i in id_train]
-        ids_train_val_test["id_val"] = [dat[i][id_tag] for i in id_val]
-        ids_train_val_test["id_test"] = [dat[i][id_tag] for i in id_test]
-        dumpjson(
-            data=ids_train_val_test,
-            filename=os.path.join(output_dir, "ids_train_val_test.json"),
-        )
-        dataset_train = [dat[x] for x in id_train]
-        dataset_val = [dat[x] for x in id_val]
-        dataset_test = [dat[x] for x in id_test]
-
-        if standard_scalar_and_pca:
-            y_data = [i[target] for i in dataset_train]
-            # pipe = Pipeline([('scale', StandardScaler())])
-            if not isinstance(y_data[0], list):
-                print("Running StandardScalar")
-                y_data = np.array(y_data).reshape(-1, 1)
-            sc = StandardScaler()
-
-            sc.fit(y_data)
-            print("Mean", sc.mean_)
-            print("Variance", sc.var_)
-            try:
-                print("New max", max(y_data))
-                print("New min", min(y_data))
-            except Exception as exp:
-                print(exp)
-                pass
-            # pc = PCA(n_components=output_features)
-            # pipe = Pipeline(
-            #    [
-            #        ("scale", StandardScaler()),
-            #        ("reduce_dims", PCA(n_components=output_features)),
-            #    ]
-            # )
-            pk.dump(sc, open(os.path.join(output_dir, "sc.pkl"), "wb"))
-            # pc = PCA(n_components=10)
-            # pc.fit(y_data)
-            # pk.dump(pc, open("pca.pkl", "wb"))
-
-        if classification_threshold is None:
+    # id_test = ids[-test_size:]
+    # if standardize:
+    #    data.setup_standardizer(id_train)
+    id_train, id_val, id_test = get_id_train_val_test(
+        total_size=len(dat),
+        split_seed=split_seed,
+        train_ratio=train_ratio,
+        val_ratio=val_ratio,
+        test_ratio=test_ratio,
+        n_train=n_train,
+        n_test=n_test,
+        n_val=n_val,
+        keep_data_order=keep_data_order,
+    )
+    ids_train_val_test = {}
+    ids_train_val_test["id_train"] = [dat[i][id_tag] for i in id_train]
+    ids_train_val_test["id_val"] = [dat[i][id_tag] for i in id_val]
+    ids_train_val_test["id_test"] = [dat[i][id_tag] for i in id_test]
+    dumpjson(
+        data=ids_train_val_test,
+        filename=os.path.join(output_dir, "ids_train_val_test.json"),
+    )
+    dataset_train = [dat[x] for x in id_train]
+    dataset_test = [dat[x] for x in id_test]
+
+    if standard_scalar_and_pca:
+        y_data = [i[target] for i in dataset_train]
+        # pipe = Pipeline([('scale', StandardScaler())])
+        if not isinstance(y_data[0], list):
+            print("Running StandardScalar")
+            y_data = np.array(y_data).reshape(-1, 1)
+        sc = StandardScaler()
+
+        sc.fit(y_data)
+        print("Mean", sc.mean_)
+        print("Variance", sc.var_)
+        try:
+            print("New max", max(y_data))
+            print("New min", min(y_data))
+        except Exception as exp:
+            print(exp)
+            pass
+        # pc = PCA(n_components=output_features)
+        # pipe = Pipeline(
+        #    [
+        #        ("scale", StandardScaler()),
+        #        ("reduce_dims", PCA(n_components=output_features)),
+        #    ]
+        # )
+        pk.dump(sc, open(os.path.join(output_dir, "sc.pkl"), "wb"))
+        # pc = PCA(n_components=10)
+        # pc.fit(y_data)
+        # pk.dump(pc, open("pca.pkl", "wb"))
+
+    if classification_threshold is None:
+        try:
+            from sklearn.metrics import mean_absolute_error
+
+            print("MAX val:", max(all_targets))
+            print("MIN val:", min(all_targets))
+            print("MAD:", mean_absolute_deviation(all_targets))
             try:
-                from sklearn.metrics import mean_absolute_error
-
-                print("MAX val:", max(all_targets))
-                print("MIN val:", min(all_targets))
-                print("MAD:", mean_absolute_deviation(all_targets))
-                try:
-                    f = open(os.path.join(output_dir, "mad"), "w")
-                    line = "MAX val:" + str(max(all_targets)) + "\n"
-                    line += "MIN val:" + str(min(all_targets)) + "\n"
-                    line += (
-                        "MAD val:"
-                        + str(mean_absolute_deviation(all_targets))
-                        + "\n"
-                    )
-                    f.write(line)
-                    f.close()
-                except Exception as exp:
-                    print("Cannot write mad", exp)
-                    pass
-                # Random model precited value
-                x_bar = np.mean(np.array([i[target] for i in dataset_train]))
-                baseline_mae = mean_absolute_error(
-                    np.array([i[target] for i in dataset_test]),
-                    np.array([x_bar for i in dataset_test]),
+                f = open(os.path.join(output_dir, "mad"), "w")
+                line = "MAX val:" + str(max(all_targets)) + "\n"
+                line += "MIN val:" + str(min(all_targets)) + "\n"
+                line += (
+                    "MAD val:"
+                    + str(mean_absolute_deviation(all_targets))
+                    + "\n"
                 )
-                print("Baseline MAE:", baseline_mae)
+                f.write(line)
+                f.close()
             except Exception as exp:
-                print("Data error", exp)
+                print("Cannot write mad", exp)
                 pass
+            # Random model precited value
+            x_bar = np.mean(np.array([i[target] for i in dataset_train]))
+            baseline_mae = mean_absolute_error(
+                np.array([i[target] for i in dataset_test]),
+                np.array([x_bar for i in dataset_test]),
+            )
+            print("Baseline MAE:", baseline_mae)
+        except Exception as exp:
+            print("Data error", exp)
+            pass
 
-        train_data = get_torch_dataset(
-            dataset=dataset_train,
-            id_tag=id_tag,
-            atom_features=atom_features,
-            target=target,
-            neighbor_strategy=neighbor_strategy,
-            use_canonize=use_canonize,
-            name=dataset,
-            line_graph=line_graph,
-            cutoff=cutoff,
-            max_neighbors=max_neighbors,
-            classification=classification_threshold is not None,
-            output_dir=output_dir,
-            tmp_name="train_data",
+    # featurize once, then hand out index-based views of each split
+    if save_dataloader and graph_store is None and snapshot is None:
+        print("Writing dataset snapshot:", snapshot_dir)
+        save_snapshot(
+            snapshot_dir,
+            iter_graphs(
+                pd.DataFrame({"atoms": [i["atoms"] for i in dat]}),
+                neighbor_strategy=neighbor_strategy,
+                cutoff=cutoff,
+                max_neighbors=max_neighbors,
+                cachedir=cachedir,
+                use_canonize=use_canonize,
+                graph_workers=graph_workers,
+                line_graph=bool(line_graph),
+            ),
+            ids=[i[id_tag] for i in dat],
+            targets=[i[target] for i in dat],
+            params=snapshot_params,
+            line_graph=bool(line_graph),
         )
-        val_data = get_torch_dataset(
-            dataset=dataset_val,
-            id_tag=id_tag,
-            atom_features=atom_features,
-            target=target,
-            neighbor_strategy=neighbor_strategy,
-            use_canonize=use_canonize,
-            name=dataset,
-            line_graph=line_graph,
-            cutoff=cutoff,
-            max_neighbors=max_neighbors,
-            classification=classification_threshold is not None,
-            output_dir=output_dir,
-            tmp_name="val_data",
+        snapshot = load_snapshot(snapshot_dir, snapshot_params)
+    if snapshot is not None or graph_store is not None:
+        write_data_range(
+            pd.Series([i[target] for i in dat]).values,
+            output_dir,
+            "dataset",
         )
-        test_data = get_torch_dataset(
-            dataset=dataset_test,
+    if snapshot is not None:
+        data = snapshot_dataset(snapshot, **snapshot_kwargs)
+    elif graph_store is not None:
+        # graphs were streamed into a store, in the order of `dat`
+        if len(graph_store) != len(dat):
+            raise ValueError(
+                "Graph store does not match dataset",
+                len(graph_store),
+                len(dat),
+            )
+        data = snapshot_dataset(
+            {
+                "ids": [i[id_tag] for i in dat],
+                "targets": [i[target] for i in dat],
+                "store": graph_store,
+            },
+            **snapshot_kwargs,
+        )
+    else:
+        data = get_torch_dataset(
+            dataset=dat,
             id_tag=id_tag,
             atom_features=atom_features,
             target=target,
             neighbor_strategy=neighbor_strategy,
             use_canonize=use_canonize,
-            name=dataset,
             line_graph=line_graph,
             cutoff=cutoff,
             max_neighbors=max_neighbors,
             classification=classification_threshold is not None,
             output_dir=output_dir,
-            tmp_name="test_data",
+            tmp_name="dataset",
+            graph_workers=graph_workers,
+            cachedir=cachedir,
+            graph_storage=graph_storage,
+            graph_lru_size=graph_lru_size,
         )
+    for tmp_name, ids in zip(
+        ["train_data", "val_data", "test_data"],
+        [id_train, id_val, id_test],
+    ):
+        vals = pd.Series([dat[i][target] for i in ids]).values
+        write_data_range(vals, output_dir, tmp_name)
 
-        collate_fn = train_data.collate
-        if line_graph:
-            collate_fn = train_data.collate_line_graph
-
-        # use a regular pytorch dataloader
-        train_loader = DataLoader(
-            train_data,
-            batch_size=batch_size,
-            shuffle=True,
-            collate_fn=collate_fn,
-            drop_last=True,
-            num_workers=workers,
-            pin_memory=pin_memory,
-        )
+    train_data = StructureSubset(data, id_train)
+    val_data = StructureSubset(data, id_val)
+    test_data = StructureSubset(data, id_test)
 
-        val_loader = DataLoader(
-            val_data,
-            batch_size=batch_size,
-            shuffle=False,
-            collate_fn=collate_fn,
-            drop_last=True,
-            num_workers=workers,
-            pin_memory=pin_memory,
-        )
+    collate_fn = train_data.collate
+    if line_graph:
+        collate_fn = train_data.collate_line_graph
 
-        test_loader = DataLoader(
-            test_data,
-            batch_size=1,
-            shuffle=False,
-            collate_fn=collate_fn,
-            drop_last=False,
-            num_workers=workers,
-            pin_memory=pin_memory,
+    train_batching = dict(batch_size=batch_size, shuffle=True, drop_last=True)
+    val_batching = dict(batch_size=batch_size, shuffle=False, drop_last=True)
+    budget = dict(
+        max_nodes=max_batch_nodes,
+        max_edges=max_batch_edges,
+        max_triplets=max_batch_triplets,
+    )
+    use_budget = any(v is not None for v in budget.values())
+    if bucket_batching:
+        print("Bucketing batches by structure size")
+        bucketing = dict(batch_size=None if use_budget else batch_size)
+        bucketing.update(budget, drop_last=not use_budget)
+        train_batching = dict(
+            batch_sampler=BucketBatchSampler(
+                train_data.graph_sizes(), seed=split_seed, **bucketing
+            )
         )
-        if save_dataloader:
-            torch.save(train_loader, train_sample)
-            torch.save(val_loader, val_sample)
-            torch.save(test_loader, test_sample)
+        val_batching = dict(
+            batch_sampler=BucketBatchSampler(
+                val_data.graph_sizes(), shuffle=False, **bucketing
+            )
+        )
+    elif use_budget:
+        print("Packing batches with size budget", budget)
+        train_batching = dict(
+            batch_sampler=BudgetBatchSampler(
+                train_data.graph_sizes(), seed=split_seed, **budget
+            )
+        )
+        val_batching = dict(
+            batch_sampler=BudgetBatchSampler(
+                val_data.graph_sizes(), shuffle=False, **budget
+            )
+        )
+
+    # lazy graphs are cached inside the workers,
+    # so keep them alive across epochs
+    persistent_workers = graph_storage == "lazy" and workers > 0
+
+    # use a regular pytorch dataloader
+    train_loader = DataLoader(
+        train_data,
+        collate_fn=collate_fn,
+        num_workers=workers,
+        pin_memory=pin_memory,
+        persistent_workers=persistent_workers,
+        **train_batching,
+    )
+
+    val_loader = DataLoader(
+        val_data,
+        collate_fn=collate_fn,
+        num_workers=workers,
+        pin_memory=pin_memory,
+        persistent_workers=persistent_workers,
+        **val_batching,
+    )
+
+    test_loader = DataLoader(
+        test_data,
+        batch_size=1,
+        shuffle=False,
+        collate_fn=collate_fn,
+        drop_last=False,
+        num_workers=workers,
+        pin_memory=pin_memory,
+    )
     print("n_train:", len(train_loader.dataset))
     print("n_val:", len(val_loader.dataset))
     print("n_test:", len(test_loader.dataset))
@@ -0,0 +1,252 @@
+"""Local columnar index of JARVIS datasets.
+
+`jarvis.db.figshare.data` materializes every column of every record
+as Python objects. The index converts a dataset once into one NumPy
+array per column, so that training only reads the id, target and
+structure columns it needs:
+
+```
+manifest.json            format/jarvis-tools version, column kinds
+<column>.npy             number: float64 (NaN for "na"/None),
+                         string: unicode, object: pickled values
+<atoms>_lattice_mat.npy  float64 (n_records, 3, 3)
+<atoms>_offsets.npy      int64   (n_records + 1,)
+<atoms>_coords.npy       float64 (n_sites, 3)
+<atoms>_elements.npy     unicode (n_sites,)
+<atoms>_props.npy        unicode (n_sites,)
+<atoms>_cartesian.npy    bool    (n_records,)
+```
+"""
+import json
+import numbers
+import os
+from pathlib import Path
+from typing import List, Optional, Sequence, Union
+
+import jarvis
+import numpy as np
+from jarvis.db.figshare import data as jdata
+
+# bump when the index layout changes
+DATASET_INDEX_VERSION = 1
+
+DEFAULT_INDEX_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "alignn", "datasets"
+)
+
+_ATOMS_ARRAYS = (
+    "lattice_mat",
+    "offsets",
+    "coords",
+    "elements",
+    "props",
+    "cartesian",
+)
+
+
+def _column_kind(values: Sequence) -> str:
+    """Get how a column is stored: number, string, atoms or object."""
+    present = [v for v in values if v is not None and v != "na"]
+    if all(isinstance(v, numbers.Number) for v in present):
+        return "number"
+    if all(isinstance(v, str) for v in values):
+        return "string"
+    if all(isinstance(v, dict) and "lattice_mat" in v for v in values):
+        return "atoms"
+    return "object"
+
+
+def _write_atoms(path: Path, name: str, values: Sequence[dict]):
+    """Write a column of structure dicts as concatenated site arrays."""
+    n_sites = [len(v["elements"]) for v in values]
+    arrays = {
+        "lattice_mat": np.array(
+            [v["lattice_mat"] for v in values], dtype=np.float64
+        ).reshape(-1, 3, 3),
+        "offsets": np.concatenate([[0], np.cumsum(n_sites)]).astype(
+            np.int64
+        ),
+        "coords": np.array(
+            [x for v in values for x in v["coords"]], dtype=np.float64
+        ).reshape(-1, 3),
+        "elements": np.array(
+            [x for v in values for x in v["elements"]], dtype=str
+        ),
+        "props": np.array(
+            [
+                str(x)
+                for v, n in zip(values, n_sites)
+                for x in v.get("props") or [""] * n
+            ],
+            dtype=str,
+        ),
+        "cartesian": np.array([bool(v["cartesian"]) for v in values]),
+    }
+    for k, x in arrays.items():
+        np.save(path / f"{name}_{k}.npy", x)
+
+
+def build_dataset_index(
+    path: Union[str, Path], records: Sequence[dict], name: str = ""
+) -> "DatasetIndex":
+    """Write the columnar index of a list of dataset records."""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    manifest = path / "manifest.json"
+    if manifest.is_file():
+        os.remove(manifest)
+
+    keys = list(dict.fromkeys(k for r in records for k in r))
+    kinds = {}
+    for k in keys:
+        values = [r.get(k) for r in records]
+        kinds[k] = _column_kind(values)
+        if kinds[k] == "atoms":
+            _write_atoms(path, k, values)
+            continue
+        if kinds[k] == "number":
+            x = np.array(
+                [np.nan if v is None or v == "na" else v for v in values]
+            )
+            if x.dtype.kind not in "iub":
+                x = x.astype(np.float64)
+        elif kinds[k] == "string":
+            x = np.array(values, dtype=str)
+        else:
+            x = np.empty(len(values), dtype=object)
+            for i, v in enumerate(values):
+                x[i] = v
+        np.save(path / f"{k}.npy", x)
+
+    # write the manifest last: its presence marks a complete index
+    with open(manifest, "w") as f:
+        json.dump(
+            {
+                "version": DATASET_INDEX_VERSION,
+                "jarvis_version": jarvis.__version__,
+                "name": name,
+                "n_records": len(records),
+                "columns": kinds,
+            },
+            f,
+            indent=2,
+        )
+    return DatasetIndex(path)
+
+
+class DatasetIndex(object):
+    """Read-only columnar dataset index."""
+
+    def __init__(self, path: Union[str, Path]):
+        """Open the index manifest; columns are loaded on access."""
+        self.path = Path(path)
+        with open(self.path / "manifest.json") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != DATASET_INDEX_VERSION:
+            raise ValueError(
+                "Unsupported dataset index version", self.manifest["version"]
+            )
+        self.kinds = self.manifest["columns"]
+
+    @property
+    def columns(self) -> List[str]:
+        """Get column names."""
+        return list(self.kinds)
+
+    def __len__(self):
+        """Get number of records."""
+        return self.manifest["n_records"]
+
+    def column(self, name: str) -> np.ndarray:
+        """Load a number, string or object column."""
+        if self.kinds[name] == "atoms":
+            raise ValueError("Use structures() for atoms column", name)
+        if self.kinds[name] == "object":
+            return np.load(self.path / f"{name}.npy", allow_pickle=True)
+        return np.load(self.path / f"{name}.npy", mmap_mode="r")
+
+    def structures(
+        self, name: str = "atoms", rows: Optional[Sequence[int]] = None
+    ) -> List[dict]:
+        """Get the structure dicts of `rows` (default: all)."""
+        a = {
+            k: np.load(self.path / f"{name}_{k}.npy", mmap_mode="r")
+            for k in _ATOMS_ARRAYS
+        }
+        if rows is None:
+            rows = range(len(self))
+        structures = []
+        for i in rows:
+            start, stop = a["offsets"][i], a["offsets"][i + 1]
+            structures.append(
+                {
+                    "lattice_mat": a["lattice_mat"][i].tolist(),
+                    "coords": a["coords"][start:stop].tolist(),
+                    "elements": a["elements"][start:stop].tolist(),
+                    "cartesian": bool(a["cartesian"][i]),
+                    "props": a["props"][start:stop].tolist(),
+                }
+            )
+        return structures
+
+    def records(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        rows: Optional[Sequence[int]] = None,
+    ) -> List[dict]:
+        """Get records of `rows` holding only `columns` (default: all)."""
+        if columns is None:
+            columns = self.columns
+        if rows is None:
+            rows = np.arange(len(self))
+        values = []
+        for k in columns:
+            if self.kinds[k] == "atoms":
+                values.append(self.structures(k, rows))
+            else:
+                values.append(self.column(k)[rows].tolist())
+        return [dict(zip(columns, v)) for v in zip(*values)]
+
+    def select_target(
+        self,
+        target: str,
+        classification_threshold: Optional[float] = None,
+        target_multiplication_factor: Optional[float] = None,
+    ):
+        """Get rows with a valid numeric `target`, and their target values.
+
+        Missing ("na"/NaN) targets are dropped, then values are scaled
+        by `target_multiplication_factor` and binarized at
+        `classification_threshold`.
+        """
+        if self.kinds[target] != "number":
+            raise ValueError("Not a numeric target column", target)
+        y = np.asarray(self.column(target), dtype=np.float64)
+        rows = np.flatnonzero(~np.isnan(y))
+        y = y[rows]
+        if target_multiplication_factor is not None:
+            y = y * target_multiplication_factor
+        if classification_threshold is not None:
+            y = (y > classification_threshold).astype(np.int64)
+        return rows, y
+
+
+def dataset_index(
+    name: str = "dft_3d", index_dir: Optional[str] = None
+) -> DatasetIndex:
+    """Open the index of a JARVIS dataset, building it on first use.
+
+    The index is rebuilt if it was written by another index format
+    or jarvis-tools version.
+    """
+    path = Path(index_dir or DEFAULT_INDEX_DIR) / name
+    manifest = path / "manifest.json"
+    if manifest.is_file():
+        with open(manifest) as f:
+            manifest = json.load(f)
+        current = (DATASET_INDEX_VERSION, jarvis.__version__)
+        if (manifest["version"], manifest["jarvis_version"]) == current:
+            return DatasetIndex(path)
+        print("Dataset index is outdated, rebuilding:", path)
+    print("Building dataset index:", path)
+    return build_dataset_index(path, jdata(name), name=name)
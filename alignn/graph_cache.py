@@ -0,0 +1,98 @@
+"""Content-addressed on-disk cache of crystal graphs.
+
+Graphs are stored one file per structure, keyed by a hash of the
+lattice, fractional coordinates and species, inside a directory keyed
+by the graph construction parameters. The same structure therefore maps
+to the same cache entry across dataset splits, training runs and
+property sweeps, while changing e.g. `cutoff` selects a fresh directory.
+
+Each entry holds the crystal graph together with its line graph and
+bond angle cosines, so line graphs are not rebuilt at dataset setup.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Union
+
+import dgl
+import numpy as np
+from jarvis.core.atoms import Atoms
+
+# bump when the stored graph schema changes
+GRAPH_FORMAT_VERSION = 2
+
+
+def structure_hash(atoms: Union[Atoms, dict]) -> str:
+    """Hash lattice, fractional coordinates and species of a structure."""
+    if isinstance(atoms, dict):
+        atoms = Atoms.from_dict(atoms)
+    h = hashlib.sha1()
+    for x in (atoms.lattice_mat, atoms.frac_coords):
+        h.update(np.ascontiguousarray(x, dtype=np.float64).tobytes())
+    h.update(" ".join(atoms.elements).encode())
+    return h.hexdigest()
+
+
+class GraphCache(object):
+    """Per-structure DGLGraph store for one graph parameter setting."""
+
+    def __init__(
+        self,
+        cachedir: Union[str, Path],
+        neighbor_strategy: str = "k-nearest",
+        cutoff: float = 8.0,
+        max_neighbors: int = 12,
+        use_canonize: bool = False,
+    ):
+        """Open (or create) the cache directory for these parameters."""
+        self.params = {
+            "version": GRAPH_FORMAT_VERSION,
+            "neighbor_strategy": neighbor_strategy,
+            "cutoff": float(cutoff),
+            "max_neighbors": int(max_neighbors),
+            "use_canonize": bool(use_canonize),
+        }
+        digest = hashlib.sha1(
+            json.dumps(self.params, sort_keys=True).encode()
+        ).hexdigest()[:16]
+        self.root = Path(cachedir) / "graphs" / digest
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        manifest = self.root / "params.json"
+        if not manifest.is_file():
+            with open(manifest, "w") as f:
+                json.dump(self.params, f, indent=2)
+
+    def path(self, key: str) -> Path:
+        """Get the file path of a cache entry."""
+        return self.root / key[:2] / f"{key}.bin"
+
+    def __contains__(self, key: str) -> bool:
+        """Check whether a structure is cached."""
+        return self.path(key).is_file()
+
+    def load(self, key: str, line_graph: bool = True) -> List[dgl.DGLGraph]:
+        """Load the graphs stored for a structure.
+
+        Entries hold [crystal graph, line graph];
+        the line graph is skipped when `line_graph` is False.
+        """
+        idx = None if line_graph else [0]
+        graphs, labels = dgl.load_graphs(str(self.path(key)), idx)
+        return graphs
+
+    def save(self, key: str, graphs: List[dgl.DGLGraph]):
+        """Store graphs for a structure.
+
+        Entries are written to a temporary file and renamed into place,
+        so concurrent writers and interrupted runs never leave
+        partial entries behind.
+        """
+        path = self.path(key)
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        os.close(fd)
+        dgl.save_graphs(tmp, graphs)
+        os.replace(tmp, path)
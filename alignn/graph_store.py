@@ -0,0 +1,469 @@
+"""Columnar, memory-mapped on-disk store of crystal graphs.
+
+All graphs of a dataset are concatenated into flat arrays
+(CSR-style, with per-graph offsets) so that datasets larger than RAM
+can be sliced on demand:
+
+```
+node_offsets  int64   (n_graphs + 1,)
+edge_offsets  int64   (n_graphs + 1,)
+atomic_number int32   (n_nodes,)
+src, dst      int32   (n_edges,)      graph-local node indices
+r             float32 (n_edges, 3)
+lg_offsets    int64   (n_graphs + 1,) line graph only
+lg_src, lg_dst int32  (n_lg_edges,)   graph-local edge indices
+h             float32 (n_lg_edges,)   bond angle cosines
+```
+
+Each array is a raw binary file described by `manifest.json`,
+and is opened with `np.memmap`, so resident memory stays
+proportional to the graphs actually read. `SharedGraphDataset`
+instead holds the columns in shared memory for DataLoader workers.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple, Union
+
+import dgl
+import numpy as np
+import torch
+from jarvis.core.graphs import (
+    Standardize,
+    prepare_dgl_batch,
+    prepare_line_graph_batch,
+)
+
+from alignn.graphs import StructureDataset, batch_graph_arrays
+
+# bump when the store layout changes
+STORE_FORMAT_VERSION = 1
+
+_DTYPES = {
+    "atomic_number": np.int32,
+    "src": np.int32,
+    "dst": np.int32,
+    "r": np.float32,
+    "lg_src": np.int32,
+    "lg_dst": np.int32,
+    "h": np.float32,
+}
+_WIDTHS = {"r": 3}
+
+
+class GraphStoreWriter(object):
+    """Stream graphs into a new graph store directory."""
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        line_graph: bool = True,
+        params: Optional[dict] = None,
+    ):
+        """Create the store directory and open its column files."""
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        # an overwritten store is incomplete until the new manifest is out
+        if (self.path / "manifest.json").exists():
+            os.remove(self.path / "manifest.json")
+        self.line_graph = line_graph
+        self.params = params or {}
+        self.names = [
+            k
+            for k in _DTYPES
+            if line_graph or k not in ("lg_src", "lg_dst", "h")
+        ]
+        self.files = {
+            k: open(self.path / f"{k}.bin", "wb") for k in self.names
+        }
+        self.sizes = {k: 0 for k in self.names}
+        self.offsets = {"node_offsets": [0], "edge_offsets": [0]}
+        if line_graph:
+            self.offsets["lg_offsets"] = [0]
+
+    def _write(self, name, x):
+        x = np.ascontiguousarray(x, dtype=_DTYPES[name])
+        self.files[name].write(x.tobytes())
+        self.sizes[name] += len(x)
+
+    def append(self, g: dgl.DGLGraph, lg: dgl.DGLGraph = None):
+        """Append a crystal graph (and its line graph) to the store."""
+        src, dst = g.edges()
+        self._write("atomic_number", g.ndata["atom_features"].view(-1))
+        self._write("src", src)
+        self._write("dst", dst)
+        self._write("r", g.edata["r"].numpy())
+        self.offsets["node_offsets"].append(self.sizes["atomic_number"])
+        self.offsets["edge_offsets"].append(self.sizes["src"])
+        if self.line_graph:
+            lg_src, lg_dst = lg.edges()
+            self._write("lg_src", lg_src)
+            self._write("lg_dst", lg_dst)
+            self._write("h", lg.edata["h"])
+            self.offsets["lg_offsets"].append(self.sizes["lg_src"])
+
+    def close(self):
+        """Flush column files, write offsets and the manifest."""
+        arrays = {}
+        for k in self.names:
+            self.files[k].close()
+            shape = [self.sizes[k]] + ([_WIDTHS[k]] if k in _WIDTHS else [])
+            arrays[k] = {"dtype": np.dtype(_DTYPES[k]).name, "shape": shape}
+        for k, v in self.offsets.items():
+            np.array(v, dtype=np.int64).tofile(self.path / f"{k}.bin")
+            arrays[k] = {"dtype": "int64", "shape": [len(v)]}
+
+        manifest = {
+            "version": STORE_FORMAT_VERSION,
+            "n_graphs": len(self.offsets["node_offsets"]) - 1,
+            "line_graph": self.line_graph,
+            "params": self.params,
+            "arrays": arrays,
+        }
+        # write the manifest last: its presence marks a complete store
+        tmp = self.path / "manifest.json.tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.path / "manifest.json")
+
+    def __enter__(self):
+        """Enter context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the store on leaving the context."""
+        self.close()
+
+
+def write_graph_store(
+    path: Union[str, Path],
+    graphs: Iterable,
+    line_graph=True,
+    params: Optional[dict] = None,
+):
+    """Write an iterable of graphs, or (graph, line graph) pairs."""
+    with GraphStoreWriter(path, line_graph=line_graph, params=params) as w:
+        for x in graphs:
+            if line_graph:
+                w.append(*x)
+            else:
+                w.append(x)
+    return GraphStore(path)
+
+
+class GraphStore(object):
+    """Read-only memory-mapped graph store."""
+
+    def __init__(self, path: Union[str, Path]):
+        """Open the store manifest; arrays are mapped on first use."""
+        self.path = Path(path)
+        with open(self.path / "manifest.json") as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != STORE_FORMAT_VERSION:
+            raise ValueError(
+                "Unsupported graph store version", self.manifest["version"]
+            )
+        self.line_graph = self.manifest["line_graph"]
+        self._arrays = None
+
+    @property
+    def arrays(self):
+        """Memory-mapped column arrays."""
+        if self._arrays is None:
+            self._arrays = {}
+            for k, v in self.manifest["arrays"].items():
+                path = self.path / f"{k}.bin"
+                if k.endswith("offsets"):
+                    # small, read on every access: keep in memory
+                    x = np.fromfile(path, dtype=v["dtype"])
+                elif v["shape"][0] == 0:
+                    x = np.zeros(v["shape"], dtype=v["dtype"])
+                else:
+                    # plain ndarray view, without np.memmap slicing overhead
+                    x = np.asarray(
+                        np.memmap(
+                            path,
+                            dtype=v["dtype"],
+                            mode="r",
+                            shape=tuple(v["shape"]),
+                        )
+                    )
+                self._arrays[k] = x
+        return self._arrays
+
+    def __getstate__(self):
+        """Pickle only the path, e.g. for spawned DataLoader workers."""
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def __len__(self):
+        """Get number of graphs."""
+        return self.manifest["n_graphs"]
+
+    def _slice(self, name, offsets, idx):
+        a = self.arrays
+        start, stop = a[offsets][idx], a[offsets][idx + 1]
+        return torch.from_numpy(np.array(a[name][start:stop]))
+
+    def graph_sizes(self) -> np.ndarray:
+        """Get (nodes, edges, triplets) counts of every structure."""
+        a = self.arrays
+        sizes = np.zeros((len(self), 3), dtype=np.int64)
+        sizes[:, 0] = np.diff(a["node_offsets"])
+        sizes[:, 1] = np.diff(a["edge_offsets"])
+        if self.line_graph:
+            sizes[:, 2] = np.diff(a["lg_offsets"])
+        return sizes
+
+    def get_arrays(self, idx: int, line_graph: bool = True) -> dict:
+        """Slice the raw arrays of one structure out of the store."""
+        x = {
+            "atomic_number": self._slice(
+                "atomic_number", "node_offsets", idx
+            ),
+            "src": self._slice("src", "edge_offsets", idx),
+            "dst": self._slice("dst", "edge_offsets", idx),
+            "r": self._slice("r", "edge_offsets", idx),
+        }
+        if line_graph:
+            x["lg_src"] = self._slice("lg_src", "lg_offsets", idx)
+            x["lg_dst"] = self._slice("lg_dst", "lg_offsets", idx)
+            x["h"] = self._slice("h", "lg_offsets", idx)
+        return x
+
+    def get_graph(self, idx: int) -> dgl.DGLGraph:
+        """Slice a crystal graph out of the store."""
+        src = self._slice("src", "edge_offsets", idx).long()
+        dst = self._slice("dst", "edge_offsets", idx).long()
+        z = self._slice("atomic_number", "node_offsets", idx)
+        g = dgl.graph((src, dst), num_nodes=len(z))
+        g.ndata["atomic_number"] = z.type(torch.get_default_dtype())[:, None]
+        g.edata["r"] = self._slice("r", "edge_offsets", idx)
+        return g
+
+    def get_line_graph(self, idx: int) -> dgl.DGLGraph:
+        """Slice a line graph with bond angle cosines out of the store."""
+        a = self.arrays
+        n_edges = int(a["edge_offsets"][idx + 1] - a["edge_offsets"][idx])
+        src = self._slice("lg_src", "lg_offsets", idx).long()
+        dst = self._slice("lg_dst", "lg_offsets", idx).long()
+        lg = dgl.graph((src, dst), num_nodes=n_edges)
+        lg.edata["h"] = self._slice("h", "lg_offsets", idx)
+        return lg
+
+
+class GraphStoreDataset(StructureDataset):
+    """Dataset of crystal graphs sliced from a `GraphStore`.
+
+    Samples are the raw per-structure arrays; the collate functions
+    featurize them and build the batched crystal graph and line graph
+    directly from the concatenated arrays, without per-sample DGLGraphs.
+    """
+
+    def __init__(
+        self,
+        df,
+        store: GraphStore,
+        target: str,
+        atom_features="atomic_number",
+        transform=None,
+        line_graph=False,
+        classification=False,
+        id_tag="jid",
+    ):
+        """Pytorch Dataset for graphs in a memory-mapped store.
+
+        `df` supplies ids and labels only;
+        graphs are read from `store` and featurized on access.
+        """
+        if line_graph and not store.line_graph:
+            raise ValueError("Graph store has no line graphs", store.path)
+        self.store = store
+        self.target = target
+        self.line_graph = line_graph
+        self.ids = df[id_tag]
+        self.labels = torch.tensor(df[target]).type(torch.get_default_dtype())
+        self.transform = transform
+        self.features = torch.tensor(
+            self._get_attribute_lookup(atom_features)
+        ).type(torch.get_default_dtype())
+
+        self.prepare_batch = prepare_dgl_batch
+        if line_graph:
+            self.prepare_batch = prepare_line_graph_batch
+
+        if classification:
+            self.labels = self.labels.view(-1).long()
+            print("Classification dataset.", self.labels)
+
+    def graph_sizes(self) -> np.ndarray:
+        """Get (nodes, edges, triplets) counts of every structure."""
+        sizes = self.store.graph_sizes()
+        if not self.line_graph:
+            sizes[:, 2] = 0
+        return sizes
+
+    @property
+    def graphs(self):
+        """Not available: graphs are built per batch from the store."""
+        raise NotImplementedError(
+            "GraphStoreDataset keeps no per-structure DGLGraphs,"
+            " use store.get_graph(idx)"
+        )
+
+    def _atomic_numbers(self, ids) -> torch.Tensor:
+        """Get atomic numbers of every atom of structures `ids`."""
+        return torch.cat(
+            [
+                self.store.get_arrays(i, line_graph=False)["atomic_number"]
+                for i in ids
+            ]
+        )
+
+    def setup_standardizer(self, ids):
+        """Atom-wise feature standardization transform."""
+        x = self.features[self._atomic_numbers(sorted(set(ids))).long()]
+        self.atom_feature_mean = x.mean(0)
+        self.atom_feature_std = x.std(0)
+
+        self.transform = Standardize(
+            self.atom_feature_mean, self.atom_feature_std
+        )
+
+    def __getitem__(self, idx):
+        """Get GraphStoreDataset sample: (arrays, label)."""
+        x = self.store.get_arrays(idx, line_graph=self.line_graph)
+        return x, self.labels[idx]
+
+    def _batch_graph(self, arrays: List[dict]) -> dgl.DGLGraph:
+        """Build the featurized batched crystal graph."""
+        z = torch.cat([x["atomic_number"] for x in arrays]).long()
+        g = batch_graph_arrays(
+            [len(x["atomic_number"]) for x in arrays],
+            [x["src"] for x in arrays],
+            [x["dst"] for x in arrays],
+            ndata={
+                "atomic_number": z.type(torch.get_default_dtype())[:, None],
+                "atom_features": self.features[z],
+            },
+            edata={"r": torch.cat([x["r"] for x in arrays])},
+        )
+        if self.transform:
+            g = self.transform(g)
+        return g
+
+    def _batch_line_graph(self, arrays: List[dict]) -> dgl.DGLGraph:
+        """Build the batched line graph."""
+        return batch_graph_arrays(
+            [len(x["src"]) for x in arrays],
+            [x["lg_src"] for x in arrays],
+            [x["lg_dst"] for x in arrays],
+            edata={"h": torch.cat([x["h"] for x in arrays])},
+        )
+
+    def collate(self, samples: List[Tuple[dict, torch.Tensor]]):
+        """Dataloader helper to batch graphs cross `samples`."""
+        arrays, labels = map(list, zip(*samples))
+        return self._batch_graph(arrays), torch.tensor(labels)
+
+    def collate_line_graph(self, samples: List[Tuple[dict, torch.Tensor]]):
+        """Dataloader helper to batch graphs cross `samples`."""
+        arrays, labels = map(list, zip(*samples))
+        batched_graph = self._batch_graph(arrays)
+        batched_line_graph = self._batch_line_graph(arrays)
+        if len(labels[0].size()) > 0:
+            return batched_graph, batched_line_graph, torch.stack(labels)
+        else:
+            return batched_graph, batched_line_graph, torch.tensor(labels)
+
+
+def _ranges(offsets: torch.Tensor, idx: torch.Tensor):
+    """Get column rows and row counts of graphs `idx`."""
+    start = offsets[idx]
+    counts = offsets[idx + 1] - start
+    shift = torch.repeat_interleave(
+        start - (torch.cumsum(counts, 0) - counts), counts
+    )
+    return torch.arange(int(counts.sum())) + shift, counts
+
+
+class SharedGraphDataset(GraphStoreDataset):
+    """Dataset of crystal graphs in shared-memory tensors.
+
+    The columns of `store` are copied once into shared memory,
+    which DataLoader workers map instead of copying the dataset.
+    Samples are only structure indices; `collate` slices a whole
+    batch out of the shared columns with `gather`, so the batches are
+    built in the DataLoader workers.
+    """
+
+    def __init__(self, df, store: GraphStore, **kwargs):
+        """Pytorch Dataset for graphs copied from a graph store."""
+        super().__init__(df, store, **kwargs)
+        self.columns = {
+            k: torch.from_numpy(np.array(x)).share_memory_()
+            for k, x in store.arrays.items()
+        }
+        # close the memory maps, graphs are only read from `columns`
+        store._arrays = None
+        self.labels.share_memory_()
+        self.features.share_memory_()
+
+    def graph_sizes(self) -> np.ndarray:
+        """Get (nodes, edges, triplets) counts of every structure."""
+        c = self.columns
+        sizes = np.zeros((len(self), 3), dtype=np.int64)
+        sizes[:, 0] = np.diff(c["node_offsets"].numpy())
+        sizes[:, 1] = np.diff(c["edge_offsets"].numpy())
+        if self.line_graph:
+            sizes[:, 2] = np.diff(c["lg_offsets"].numpy())
+        return sizes
+
+    def _atomic_numbers(self, ids) -> torch.Tensor:
+        """Get atomic numbers of every atom of structures `ids`."""
+        c = self.columns
+        nodes, _ = _ranges(c["node_offsets"], torch.as_tensor(ids))
+        return c["atomic_number"][nodes]
+
+    def __getitem__(self, idx):
+        """Get SharedGraphDataset sample: its index."""
+        return idx
+
+    def collate(self, samples: List[int]):
+        """Dataloader helper to gather a batch of structure indices."""
+        return self.gather(torch.as_tensor(samples, dtype=torch.int64))
+
+    collate_line_graph = collate
+
+    def gather(self, idx: torch.Tensor):
+        """Build the batch of structures `idx` from the shared columns."""
+        c = self.columns
+        nodes, num_nodes = _ranges(c["node_offsets"], idx)
+        edges, num_edges = _ranges(c["edge_offsets"], idx)
+        z = c["atomic_number"][nodes].long()
+        g = batch_graph_arrays(
+            num_nodes,
+            c["src"][edges],
+            c["dst"][edges],
+            ndata={
+                "atomic_number": z.type(torch.get_default_dtype())[:, None],
+                "atom_features": self.features[z],
+            },
+            edata={"r": c["r"][edges]},
+            num_edges=num_edges,
+        )
+        if self.transform:
+            g = self.transform(g)
+        if not self.line_graph:
+            return g, self.labels[idx]
+
+        triplets, num_triplets = _ranges(c["lg_offsets"], idx)
+        lg = batch_graph_arrays(
+            num_edges,
+            c["lg_src"][triplets],
+            c["lg_dst"][triplets],
+            edata={"h": c["h"][triplets]},
+            num_edges=num_triplets,
+        )
+        return g, lg, self.labels[idx]
@@ -0,0 +1,405 @@
+"""Crystal graph and line graph construction for ALIGNN models."""
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+import dgl
+import numpy as np
+import pandas as pd
+import torch
+from jarvis.core.atoms import Atoms
+from jarvis.core.graphs import (
+    Standardize,
+    compute_bond_cosines,
+    prepare_dgl_batch,
+    prepare_line_graph_batch,
+)
+from jarvis.core.specie import chem_data, get_node_attributes
+from tqdm import tqdm
+
+from alignn.graph_cache import GraphCache, structure_hash
+from alignn.neighbors import build_undirected_edgedata, nearest_neighbor_edges
+
+
+def atom_dgl_multigraph(
+    atoms=None,
+    neighbor_strategy: str = "k-nearest",
+    cutoff: float = 8.0,
+    max_neighbors: int = 12,
+    atom_features: str = "cgcnn",
+    compute_line_graph: bool = True,
+    use_canonize: bool = False,
+):
+    """Obtain a DGLGraph for Atoms object.
+
+    Drop-in replacement for `jarvis.core.graphs.Graph.atom_dgl_multigraph`
+    backed by the vectorized neighbor search in `alignn.neighbors`.
+    """
+    if neighbor_strategy != "k-nearest":
+        raise ValueError("Not implemented yet", neighbor_strategy)
+
+    src, dst, images = nearest_neighbor_edges(
+        atoms=atoms,
+        cutoff=cutoff,
+        max_neighbors=max_neighbors,
+        use_canonize=use_canonize,
+    )
+    u, v, r = build_undirected_edgedata(atoms, src, dst, images)
+
+    # build up atom attribute tensor, one lookup per species
+    species = {
+        s: list(get_node_attributes(s, atom_features=atom_features))
+        for s in set(atoms.elements)
+    }
+    node_features = torch.tensor(
+        np.array([species[s] for s in atoms.elements])
+    ).type(torch.get_default_dtype())
+
+    g = dgl.graph(
+        (torch.tensor(u), torch.tensor(v)), num_nodes=len(atoms.elements)
+    )
+    g.ndata["atom_features"] = node_features
+    g.edata["r"] = torch.tensor(r).type(torch.get_default_dtype())
+
+    if compute_line_graph:
+        return g, build_line_graph(g)
+    else:
+        return g
+
+
+def build_line_graph(g: dgl.DGLGraph) -> dgl.DGLGraph:
+    """Construct atomistic line graph with bond angle cosine features.
+
+    Nodes of the line graph are bonds of `g`, edges are bond pairs,
+    with the angle cosines stored in lg.edata["h"].
+    The bond vectors are only borrowed to compute the angles,
+    so the line graph is self-contained when serialized.
+    """
+    lg = g.line_graph(shared=True)
+    lg.apply_edges(compute_bond_cosines)
+    lg.ndata.pop("r")
+    return lg
+
+
+def batch_graph_arrays(
+    num_nodes: Sequence[int],
+    src: Sequence[torch.Tensor],
+    dst: Sequence[torch.Tensor],
+    ndata: Optional[dict] = None,
+    edata: Optional[dict] = None,
+    num_edges: Optional[Sequence[int]] = None,
+) -> dgl.DGLGraph:
+    """Build a batched DGLGraph from per-graph edge arrays.
+
+    Collate for graph store samples, which are arrays rather than
+    DGLGraphs: graph-local `src` and `dst` indices are shifted by
+    cumulative node offsets and the batch is constructed in one shot,
+    with `ndata`/`edata` features already concatenated over the batch.
+    If `num_edges` is given, `src` and `dst` are single tensors
+    already concatenated over the batch.
+
+    This avoids building one DGLGraph per sample before `dgl.batch`,
+    but it is not faster than `dgl.batch` on graphs already in memory
+    (see `alignn.scripts.benchmark_collate`), so in-memory datasets
+    keep using `dgl.batch`.
+    """
+    num_nodes = torch.as_tensor(num_nodes, dtype=torch.int64)
+    if num_edges is None:
+        num_edges = [len(u) for u in src]
+        src, dst = torch.cat(src), torch.cat(dst)
+    num_edges = torch.as_tensor(num_edges, dtype=torch.int64)
+    offsets = torch.repeat_interleave(
+        torch.cumsum(num_nodes, 0) - num_nodes, num_edges
+    )
+    u = src.long() + offsets
+    v = dst.long() + offsets
+    g = dgl.graph((u, v), num_nodes=int(num_nodes.sum()))
+    for k, x in (ndata or {}).items():
+        g.ndata[k] = x
+    for k, x in (edata or {}).items():
+        g.edata[k] = x
+    g.set_batch_num_nodes(num_nodes)
+    g.set_batch_num_edges(num_edges)
+    return g
+
+
+class StructureDataset(torch.utils.data.Dataset):
+    """Dataset of crystal DGLGraphs."""
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        graphs: Sequence[dgl.DGLGraph],
+        target: str,
+        atom_features="atomic_number",
+        transform=None,
+        line_graph=False,
+        classification=False,
+        id_tag="jid",
+        line_graphs: Optional[Sequence[dgl.DGLGraph]] = None,
+    ):
+        """Pytorch Dataset for atomistic graphs.
+
+        `df`: pandas dataframe from e.g. jarvis.db.figshare.data
+        `graphs`: DGLGraph representations corresponding to rows in `df`
+        `target`: key for label column in `df`
+        `line_graphs`: precomputed line graphs, e.g. from the graph cache;
+        built here from `graphs` if not provided
+        """
+        self.df = df
+        self.graphs = graphs
+        self.target = target
+        self.line_graph = line_graph
+
+        self.ids = self.df[id_tag]
+        self.labels = torch.tensor(self.df[target]).type(
+            torch.get_default_dtype()
+        )
+        self.transform = transform
+
+        self.features = self._get_attribute_lookup(atom_features)
+
+        # load selected node representation
+        for g in graphs:
+            self._featurize(g)
+
+        self.prepare_batch = prepare_dgl_batch
+        if line_graph:
+            self.prepare_batch = prepare_line_graph_batch
+            if line_graphs is None:
+                print("building line graphs")
+                line_graphs = [build_line_graph(g) for g in tqdm(graphs)]
+            self.line_graphs = line_graphs
+
+        if classification:
+            self.labels = self.labels.view(-1).long()
+            print("Classification dataset.", self.labels)
+
+    @staticmethod
+    def _get_attribute_lookup(atom_features: str = "cgcnn"):
+        """Build a lookup array indexed by atomic number."""
+        max_z = max(v["Z"] for v in chem_data.values())
+
+        # get feature shape (referencing Carbon)
+        template = get_node_attributes("C", atom_features)
+
+        features = np.zeros((1 + max_z, len(template)))
+
+        for element, v in chem_data.items():
+            z = v["Z"]
+            x = get_node_attributes(element, atom_features)
+
+            if x is not None:
+                features[z, :] = x
+
+        return features
+
+    def _featurize(self, g: dgl.DGLGraph):
+        """Replace atomic numbers in g.ndata["atom_features"] by features."""
+        z = g.ndata.pop("atom_features")
+        g.ndata["atomic_number"] = z
+        z = z.type(torch.IntTensor).squeeze()
+        f = torch.tensor(self.features[z]).type(torch.FloatTensor)
+        if g.num_nodes() == 1:
+            f = f.unsqueeze(0)
+        g.ndata["atom_features"] = f
+
+    def __len__(self):
+        """Get length."""
+        return self.labels.shape[0]
+
+    def __getitem__(self, idx):
+        """Get StructureDataset sample."""
+        g = self.graphs[idx]
+        label = self.labels[idx]
+
+        if self.transform:
+            g = self.transform(g)
+
+        if self.line_graph:
+            return g, self.line_graphs[idx], label
+
+        return g, label
+
+    def graph_sizes(self) -> np.ndarray:
+        """Get (nodes, edges, triplets) counts of every structure."""
+        sizes = np.zeros((len(self), 3), dtype=np.int64)
+        for i, g in enumerate(self.graphs):
+            sizes[i, 0] = g.num_nodes()
+            sizes[i, 1] = g.num_edges()
+            if self.line_graph:
+                sizes[i, 2] = self.line_graphs[i].num_edges()
+        return sizes
+
+    def setup_standardizer(self, ids):
+        """Atom-wise feature standardization transform."""
+        x = torch.cat(
+            [
+                g.ndata["atom_features"]
+                for idx, g in enumerate(self.graphs)
+                if idx in ids
+            ]
+        )
+        self.atom_feature_mean = x.mean(0)
+        self.atom_feature_std = x.std(0)
+
+        self.transform = Standardize(
+            self.atom_feature_mean, self.atom_feature_std
+        )
+
+    @staticmethod
+    def collate(samples: List[Tuple[dgl.DGLGraph, torch.Tensor]]):
+        """Dataloader helper to batch graphs cross `samples`."""
+        graphs, labels = map(list, zip(*samples))
+        batched_graph = dgl.batch(graphs)
+        return batched_graph, torch.tensor(labels)
+
+    @staticmethod
+    def collate_line_graph(
+        samples: List[Tuple[dgl.DGLGraph, dgl.DGLGraph, torch.Tensor]]
+    ):
+        """Dataloader helper to batch graphs cross `samples`."""
+        graphs, line_graphs, labels = map(list, zip(*samples))
+        batched_graph = dgl.batch(graphs)
+        batched_line_graph = dgl.batch(line_graphs)
+        if len(labels[0].size()) > 0:
+            return batched_graph, batched_line_graph, torch.stack(labels)
+        else:
+            return batched_graph, batched_line_graph, torch.tensor(labels)
+
+
+class LazyStructureDataset(StructureDataset):
+    """Dataset of crystal DGLGraphs built on first access.
+
+    Graphs are constructed from the atoms dicts in `df` inside
+    `__getitem__`, i.e. in the DataLoader worker processes,
+    and the most recently used `lru_size` samples are kept per worker.
+    An optional `GraphCache` is read first and filled on misses.
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        target: str,
+        atom_features="atomic_number",
+        transform=None,
+        line_graph=False,
+        classification=False,
+        id_tag="jid",
+        neighbor_strategy="k-nearest",
+        cutoff=8.0,
+        max_neighbors=12,
+        use_canonize=False,
+        cache: Optional[GraphCache] = None,
+        lru_size: int = 1024,
+    ):
+        """Pytorch Dataset building graphs on demand."""
+        self.atoms = df["atoms"].tolist()
+        self.target = target
+        self.line_graph = line_graph
+        self.ids = df[id_tag]
+        self.labels = torch.tensor(df[target]).type(
+            torch.get_default_dtype()
+        )
+        self.transform = transform
+        self.features = self._get_attribute_lookup(atom_features)
+        self.graph_params = dict(
+            neighbor_strategy=neighbor_strategy,
+            cutoff=cutoff,
+            max_neighbors=max_neighbors,
+            use_canonize=use_canonize,
+        )
+        self.cache = cache
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+
+        self.prepare_batch = prepare_dgl_batch
+        if line_graph:
+            self.prepare_batch = prepare_line_graph_batch
+
+        if classification:
+            self.labels = self.labels.view(-1).long()
+            print("Classification dataset.", self.labels)
+
+    def graph_sizes(self) -> np.ndarray:
+        """Get (nodes, edges, triplets) counts of every structure.
+
+        Counts of structures in the `GraphCache` are read from their
+        entries. Graphs not built yet are sized from the atom count,
+        with up to 2 * `max_neighbors` edges per atom (nearest
+        neighbors and the reverse edges) and as many triplets per edge.
+        These bounds overestimate typical graphs, by about 1.5x for
+        edges and 2x for triplets, so size budgets pack fewer
+        uncached structures per batch than they could.
+        """
+        k = self.graph_params["max_neighbors"]
+        sizes = np.zeros((len(self.atoms), 3), dtype=np.int64)
+        for i, atoms in enumerate(self.atoms):
+            if self.cache is not None:
+                key = structure_hash(atoms)
+                if key in self.cache:
+                    graphs = self.cache.load(key, line_graph=self.line_graph)
+                    g = graphs[0]
+                    sizes[i, :2] = g.num_nodes(), g.num_edges()
+                    if self.line_graph:
+                        sizes[i, 2] = graphs[1].num_edges()
+                    continue
+            if isinstance(atoms, dict):
+                nodes = len(atoms["elements"])
+            else:
+                nodes = len(atoms.elements)
+            sizes[i, :2] = nodes, 2 * k * nodes
+            if self.line_graph:
+                sizes[i, 2] = 4 * k * k * nodes
+        return sizes
+
+    def _build(self, idx):
+        """Construct (or load from cache) the graphs of one structure."""
+        atoms = self.atoms[idx]
+        if self.cache is not None:
+            key = structure_hash(atoms)
+            if key in self.cache:
+                return self.cache.load(key, line_graph=self.line_graph)
+
+        if isinstance(atoms, dict):
+            atoms = Atoms.from_dict(atoms)
+        g = atom_dgl_multigraph(
+            atoms,
+            atom_features="atomic_number",
+            compute_line_graph=False,
+            **self.graph_params,
+        )
+        if self.cache is not None:
+            lg = build_line_graph(g)
+            self.cache.save(key, [g, lg])
+            return [g, lg] if self.line_graph else [g]
+        if self.line_graph:
+            return [g, build_line_graph(g)]
+        return [g]
+
+    def _get_graphs(self, idx):
+        """Get featurized graphs through the LRU cache."""
+        if idx in self._lru:
+            self._lru.move_to_end(idx)
+            return self._lru[idx]
+        graphs = self._build(idx)
+        self._featurize(graphs[0])
+        if self.lru_size > 0:
+            self._lru[idx] = graphs
+            if len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+        return graphs
+
+    def __getitem__(self, idx):
+        """Get LazyStructureDataset sample."""
+        idx = int(idx)
+        graphs = self._get_graphs(idx)
+        g = graphs[0]
+        label = self.labels[idx]
+
+        if self.transform:
+            g = self.transform(g)
+
+        if self.line_graph:
+            return g, graphs[1], label
+
+        return g, label
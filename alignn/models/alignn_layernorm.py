@@ -15,7 +15,7 @@ from pydantic.typing import Literal
 from torch import nn
 from torch.nn import functional as F
 
-from alignn.models.utils import RBFExpansion
+from alignn.models.utils import RBFExpansion, gate_denominator_input
 from alignn.utils import BaseSettings
 
 
@@ -108,8 +108,10 @@ class EdgeGatedGraphConv(nn.Module):
         g.update_all(
             fn.u_mul_e("Bh", "sigma", "m"), fn.sum("m", "sum_sigma_h")
         )
-        g.update_all(fn.copy_e("sigma", "m"), fn.sum("m", "sum_sigma"))
-        g.ndata["h"] = g.ndata["sum_sigma_h"] / (g.ndata["sum_sigma"] + 1e-6)
+        sum_sigma = dgl.ops.copy_e_sum(
+            g, gate_denominator_input(g.edata["sigma"])
+        )
+        g.ndata["h"] = g.ndata["sum_sigma_h"] / (sum_sigma + 1e-6)
         x = self.src_update(node_feats) + g.ndata.pop("h")
 
         # softmax version seems to perform slightly worse
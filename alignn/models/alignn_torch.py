@@ -0,0 +1,545 @@
+"""Atomistic LIne Graph Neural Network without DGL.
+
+Pure PyTorch implementation of `alignn.models.alignn`: graphs are
+plain edge index tensors, and message passing uses `index_select`
+and `index_add`. Parameter names match the DGL implementation,
+so state_dicts load into either backend, and the model can be
+compiled with TorchScript.
+"""
+from typing import List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import torch
+from jarvis.core.specie import get_node_attributes
+from pydantic.typing import Literal
+from torch import nn
+from torch.nn import functional as F
+
+from alignn.models.utils import RBFExpansion, gate_denominator_input
+from alignn.neighbors import build_undirected_edgedata, nearest_neighbor_edges
+from alignn.utils import BaseSettings
+
+
+class ALIGNNTorchConfig(BaseSettings):
+    """Hyperparameter schema for jarvisdgl.models.alignn_torch."""
+
+    name: Literal["alignn", "alignn_torch"]
+    alignn_layers: int = 4
+    gcn_layers: int = 4
+    atom_input_features: int = 92
+    edge_input_features: int = 80
+    triplet_input_features: int = 40
+    embedding_features: int = 64
+    hidden_features: int = 256
+    output_features: int = 1
+
+    # if link == log, apply `exp` to final outputs
+    # to constrain predictions to be positive
+    link: Literal["identity", "log", "logit"] = "identity"
+    zero_inflated: bool = False
+    classification: bool = False
+
+    class Config:
+        """Configure model settings behavior."""
+
+        env_prefix = "jv_model"
+
+
+class ALIGNNGraph(NamedTuple):
+    """Batched crystal graph and line graph as plain tensors.
+
+    Line graph nodes are the crystal graph edges, so `lg_src` and
+    `lg_dst` index into the crystal graph edge list.
+    """
+
+    # (n_nodes, atom_input_features)
+    atom_features: torch.Tensor
+    # (n_edges, 3) bond displacement vectors
+    r: torch.Tensor
+    # (n_edges,) crystal graph edges src -> dst
+    src: torch.Tensor
+    dst: torch.Tensor
+    # (n_triplets,) bond angle cosines
+    h: torch.Tensor
+    # (n_triplets,) line graph edges lg_src -> lg_dst
+    lg_src: torch.Tensor
+    lg_dst: torch.Tensor
+    # (n_nodes,) index of the structure of each atom
+    graph_index: torch.Tensor
+    num_graphs: int
+
+
+def line_graph_edges(
+    src: torch.Tensor, dst: torch.Tensor, num_nodes: int
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Get edge pairs (a -> b, b -> c) of the line graph, with backtracking.
+
+    Same edge set as `dgl.DGLGraph.line_graph`.
+    """
+    order = torch.argsort(src, stable=True)
+    out_degree = torch.bincount(src, minlength=num_nodes)
+    start = torch.cumsum(out_degree, 0) - out_degree
+    counts = out_degree[dst]
+    lg_src = torch.repeat_interleave(torch.arange(len(src)), counts)
+    # position of each pair within the out-edges of the shared node b
+    local = torch.arange(int(counts.sum())) - torch.repeat_interleave(
+        torch.cumsum(counts, 0) - counts, counts
+    )
+    lg_dst = order[start[dst][lg_src] + local]
+    return lg_src, lg_dst
+
+
+def bond_cosines(
+    r: torch.Tensor, lg_src: torch.Tensor, lg_dst: torch.Tensor
+) -> torch.Tensor:
+    """Compute bond angle cosines of line graph edges (a -> b, b -> c)."""
+    r1 = -r[lg_src]
+    r2 = r[lg_dst]
+    bond_cosine = torch.sum(r1 * r2, dim=1) / (
+        torch.norm(r1, dim=1) * torch.norm(r2, dim=1)
+    )
+    return torch.clamp(bond_cosine, -1, 1)
+
+
+def sort_edges(g: ALIGNNGraph) -> ALIGNNGraph:
+    """Reorder crystal and line graph edges by destination.
+
+    Aggregating messages with `index_add` is faster for sorted
+    indices; predictions do not depend on the edge order.
+    """
+    perm = torch.argsort(g.dst, stable=True)
+    inverse = torch.empty_like(perm)
+    inverse[perm] = torch.arange(len(perm))
+    lg_src, lg_dst = inverse[g.lg_src], inverse[g.lg_dst]
+    lg_perm = torch.argsort(lg_dst, stable=True)
+    return g._replace(
+        r=g.r[perm],
+        src=g.src[perm],
+        dst=g.dst[perm],
+        h=g.h[lg_perm],
+        lg_src=lg_src[lg_perm],
+        lg_dst=lg_dst[lg_perm],
+    )
+
+
+def atoms_to_graph(
+    atoms,
+    cutoff: float = 8.0,
+    max_neighbors: int = 12,
+    atom_features: str = "cgcnn",
+    use_canonize: bool = False,
+) -> ALIGNNGraph:
+    """Build the k-nearest neighbor crystal graph of an Atoms object.
+
+    Same graph as `alignn.graphs.atom_dgl_multigraph`, without DGL.
+    """
+    src, dst, images = nearest_neighbor_edges(
+        atoms=atoms,
+        cutoff=cutoff,
+        max_neighbors=max_neighbors,
+        use_canonize=use_canonize,
+    )
+    u, v, r = build_undirected_edgedata(atoms, src, dst, images)
+    species = {
+        s: list(get_node_attributes(s, atom_features=atom_features))
+        for s in set(atoms.elements)
+    }
+    dtype = torch.get_default_dtype()
+    node_features = torch.tensor(
+        np.array([species[s] for s in atoms.elements])
+    ).type(dtype)
+
+    u, v = torch.tensor(u), torch.tensor(v)
+    r = torch.tensor(r).type(dtype)
+    lg_src, lg_dst = line_graph_edges(u, v, len(atoms.elements))
+    g = ALIGNNGraph(
+        atom_features=node_features,
+        r=r,
+        src=u,
+        dst=v,
+        h=bond_cosines(r, lg_src, lg_dst),
+        lg_src=lg_src,
+        lg_dst=lg_dst,
+        graph_index=torch.zeros(len(atoms.elements), dtype=torch.int64),
+        num_graphs=1,
+    )
+    return sort_edges(g)
+
+
+def batch_graphs(graphs: Sequence[ALIGNNGraph]) -> ALIGNNGraph:
+    """Concatenate graphs into one batch, keeping edges sorted."""
+    num_nodes = torch.tensor([len(g.atom_features) for g in graphs])
+    num_edges = torch.tensor([len(g.src) for g in graphs])
+    node_offsets = torch.cumsum(num_nodes, 0) - num_nodes
+    edge_offsets = torch.cumsum(num_edges, 0) - num_edges
+    num_graphs = [g.num_graphs for g in graphs]
+    graph_offsets = np.cumsum([0] + num_graphs[:-1])
+    return ALIGNNGraph(
+        atom_features=torch.cat([g.atom_features for g in graphs]),
+        r=torch.cat([g.r for g in graphs]),
+        src=torch.cat([g.src + k for g, k in zip(graphs, node_offsets)]),
+        dst=torch.cat([g.dst + k for g, k in zip(graphs, node_offsets)]),
+        h=torch.cat([g.h for g in graphs]),
+        lg_src=torch.cat([g.lg_src + k for g, k in zip(graphs, edge_offsets)]),
+        lg_dst=torch.cat([g.lg_dst + k for g, k in zip(graphs, edge_offsets)]),
+        graph_index=torch.cat(
+            [
+                g.graph_index + int(k)
+                for g, k in zip(graphs, graph_offsets)
+            ]
+        ),
+        num_graphs=sum(num_graphs),
+    )
+
+
+def from_dgl(g, lg=None) -> ALIGNNGraph:
+    """Convert a (batched) DGL crystal graph and line graph."""
+    src, dst = g.edges()
+    h = torch.zeros(0)
+    lg_src = lg_dst = torch.zeros(0, dtype=torch.int64)
+    if lg is not None:
+        lg_src, lg_dst = lg.edges()
+        h = lg.edata["h"]
+    num_nodes = g.batch_num_nodes()
+    g = ALIGNNGraph(
+        atom_features=g.ndata["atom_features"],
+        r=g.edata["r"],
+        src=src,
+        dst=dst,
+        h=h,
+        lg_src=lg_src,
+        lg_dst=lg_dst,
+        graph_index=torch.repeat_interleave(
+            torch.arange(len(num_nodes)), num_nodes
+        ),
+        num_graphs=len(num_nodes),
+    )
+    return sort_edges(g)
+
+
+class EdgeGatedGraphConv(nn.Module):
+    """Edge gated graph convolution from arxiv:1711.07553.
+
+    see also arxiv:2003.0098.
+
+    This is similar to CGCNN, but edge features only go into
+    the soft attention / edge gating function, and the primary
+    node update function is W cat(u, v) + b
+    """
+
+    def __init__(
+        self, input_features: int, output_features: int, residual: bool = True
+    ):
+        """Initialize parameters for ALIGNN update."""
+        super().__init__()
+        self.residual = residual
+        self.src_gate = nn.Linear(input_features, output_features)
+        self.dst_gate = nn.Linear(input_features, output_features)
+        self.edge_gate = nn.Linear(input_features, output_features)
+        self.bn_edges = nn.BatchNorm1d(output_features)
+
+        self.src_update = nn.Linear(input_features, output_features)
+        self.dst_update = nn.Linear(input_features, output_features)
+        self.bn_nodes = nn.BatchNorm1d(output_features)
+
+    def forward(
+        self,
+        src: torch.Tensor,
+        dst: torch.Tensor,
+        node_feats: torch.Tensor,
+        edge_feats: torch.Tensor,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Edge-gated graph convolution over edges src -> dst.
+
+        h_i^l+1 = ReLU(U h_i + sum_{j->i} eta_{ij} ⊙ V h_j)
+        """
+        # Softplus(Linear(u || v || e))
+        m = (
+            self.src_gate(node_feats).index_select(0, src)
+            + self.dst_gate(node_feats).index_select(0, dst)
+            + self.edge_gate(edge_feats)
+        )
+
+        sigma = torch.sigmoid(m)
+        Bh = self.dst_update(node_feats).index_select(0, src)
+        zeros = node_feats.new_zeros(node_feats.shape[0], sigma.shape[1])
+        sum_sigma_h = zeros.to(sigma.dtype).index_add(0, dst, Bh * sigma)
+        gates = gate_denominator_input(sigma)
+        sum_sigma = zeros.to(gates.dtype).index_add(0, dst, gates)
+        h = sum_sigma_h / (sum_sigma + 1e-6)
+        x = self.src_update(node_feats) + h
+
+        # node and edge updates
+        x = F.silu(self.bn_nodes(x))
+        y = F.silu(self.bn_edges(m))
+
+        if self.residual:
+            x = node_feats + x
+            y = edge_feats + y
+
+        return x, y
+
+
+class ALIGNNConv(nn.Module):
+    """Line graph update."""
+
+    def __init__(
+        self,
+        in_features: int,
+        out_features: int,
+    ):
+        """Set up ALIGNN parameters."""
+        super().__init__()
+        self.node_update = EdgeGatedGraphConv(in_features, out_features)
+        self.edge_update = EdgeGatedGraphConv(out_features, out_features)
+
+    def forward(
+        self,
+        g: ALIGNNGraph,
+        x: torch.Tensor,
+        y: torch.Tensor,
+        z: torch.Tensor,
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """Node and Edge updates for ALIGNN layer.
+
+        x: node input features
+        y: edge input features
+        z: edge pair input features
+        """
+        # Edge-gated graph convolution update on crystal graph
+        x, m = self.node_update(g.src, g.dst, x, y)
+
+        # Edge-gated graph convolution update on line graph
+        y, z = self.edge_update(g.lg_src, g.lg_dst, m, z)
+
+        return x, y, z
+
+
+class MLPLayer(nn.Module):
+    """Multilayer perceptron layer helper."""
+
+    def __init__(self, in_features: int, out_features: int):
+        """Linear, Batchnorm, SiLU layer."""
+        super().__init__()
+        self.layer = nn.Sequential(
+            nn.Linear(in_features, out_features),
+            nn.BatchNorm1d(out_features),
+            nn.SiLU(),
+        )
+
+    def forward(self, x):
+        """Linear, Batchnorm, silu layer."""
+        return self.layer(x)
+
+
+class ALIGNN(nn.Module):
+    """Atomistic Line graph network.
+
+    Chain alternating gated graph convolution updates on crystal graph
+    and atomistic line graph.
+    """
+
+    def __init__(
+        self,
+        config: ALIGNNTorchConfig = ALIGNNTorchConfig(name="alignn_torch"),
+    ):
+        """Initialize class with number of input features, conv layers."""
+        super().__init__()
+        self.classification = config.classification
+
+        self.atom_embedding = MLPLayer(
+            config.atom_input_features, config.hidden_features
+        )
+
+        self.edge_embedding = nn.Sequential(
+            RBFExpansion(
+                vmin=0,
+                vmax=8.0,
+                bins=config.edge_input_features,
+            ),
+            MLPLayer(config.edge_input_features, config.embedding_features),
+            MLPLayer(config.embedding_features, config.hidden_features),
+        )
+        self.angle_embedding = nn.Sequential(
+            RBFExpansion(
+                vmin=-1,
+                vmax=1.0,
+                bins=config.triplet_input_features,
+            ),
+            MLPLayer(config.triplet_input_features, config.embedding_features),
+            MLPLayer(config.embedding_features, config.hidden_features),
+        )
+
+        self.alignn_layers = nn.ModuleList(
+            [
+                ALIGNNConv(
+                    config.hidden_features,
+                    config.hidden_features,
+                )
+                for idx in range(config.alignn_layers)
+            ]
+        )
+        self.gcn_layers = nn.ModuleList(
+            [
+                EdgeGatedGraphConv(
+                    config.hidden_features, config.hidden_features
+                )
+                for idx in range(config.gcn_layers)
+            ]
+        )
+
+        if self.classification:
+            self.fc = nn.Linear(config.hidden_features, 2)
+        else:
+            self.fc = nn.Linear(config.hidden_features, config.output_features)
+        self.softmax = nn.LogSoftmax(dim=1)
+        self.link_name = config.link
+        if config.link == "log":
+            avg_gap = 0.7  # magic number -- average bandgap in dft_3d
+            self.fc.bias.data = torch.tensor(
+                np.log(avg_gap), dtype=torch.float
+            )
+
+    def forward(self, g: ALIGNNGraph) -> torch.Tensor:
+        """ALIGNN : start with `atom_features`.
+
+        x: atom features
+        y: bond features
+        z: angle features
+        """
+        z = g.h
+        if len(self.alignn_layers) > 0:
+            # angle features (fixed)
+            z = self.angle_embedding(g.h)
+
+        # initial node features: atom feature network...
+        x = self.atom_embedding(g.atom_features)
+
+        # initial bond features
+        bondlength = torch.norm(g.r, dim=1)
+        y = self.edge_embedding(bondlength)
+
+        # ALIGNN updates: update node, edge, triplet features
+        for alignn_layer in self.alignn_layers:
+            x, y, z = alignn_layer(g, x, y, z)
+
+        # gated GCN updates: update node, edge features
+        for gcn_layer in self.gcn_layers:
+            x, y = gcn_layer(g.src, g.dst, x, y)
+
+        # average pooling over the atoms of each structure
+        h = torch.zeros(
+            g.num_graphs, x.shape[1], dtype=x.dtype, device=x.device
+        ).index_add(0, g.graph_index, x)
+        counts = torch.bincount(g.graph_index, minlength=g.num_graphs)
+        h = h / counts.unsqueeze(1).to(x.dtype)
+        out = self.fc(h)
+
+        if self.link_name == "log":
+            out = torch.exp(out)
+        elif self.link_name == "logit":
+            out = torch.sigmoid(out)
+
+        if self.classification:
+            out = self.softmax(out)
+        return torch.squeeze(out)
+
+
+class ALIGNNInference(nn.Module):
+    """ALIGNN inference on plain tensors, for TorchScript/torch.compile.
+
+    Inputs of a batch of structures:
+    atom_features (n_nodes, atom_input_features),
+    edge_index (2, n_edges) bonds src -> dst,
+    r (n_edges, 3) bond displacement vectors,
+    triplet_index (2, n_triplets) bond pairs (a -> b, b -> c),
+    num_atoms (n_structures,) atoms per structure.
+    """
+
+    def __init__(self, model: ALIGNN):
+        """Wrap a pure PyTorch ALIGNN in eval mode."""
+        super().__init__()
+        self.model = model.eval()
+
+    def forward(
+        self,
+        atom_features: torch.Tensor,
+        edge_index: torch.Tensor,
+        r: torch.Tensor,
+        triplet_index: torch.Tensor,
+        num_atoms: torch.Tensor,
+    ) -> torch.Tensor:
+        """Predict a batch of structures."""
+        graph_index = torch.repeat_interleave(
+            torch.arange(num_atoms.shape[0], device=num_atoms.device),
+            num_atoms,
+            output_size=atom_features.shape[0],
+        )
+        g = ALIGNNGraph(
+            atom_features=atom_features,
+            r=r,
+            src=edge_index[0],
+            dst=edge_index[1],
+            h=bond_cosines(r, triplet_index[0], triplet_index[1]),
+            lg_src=triplet_index[0],
+            lg_dst=triplet_index[1],
+            graph_index=graph_index,
+            num_graphs=num_atoms.shape[0],
+        )
+        return self.model(g)
+
+
+def inference_inputs(g: ALIGNNGraph) -> Tuple[torch.Tensor, ...]:
+    """Get the `ALIGNNInference` inputs of a batch."""
+    return (
+        g.atom_features,
+        torch.stack([g.src, g.dst]),
+        g.r,
+        torch.stack([g.lg_src, g.lg_dst]),
+        torch.bincount(g.graph_index, minlength=g.num_graphs),
+    )
+
+
+def inference_model(
+    state_dict: dict,
+    config=ALIGNNTorchConfig(name="alignn_torch"),
+    mode: str = "script",
+) -> nn.Module:
+    """Build an inference module from a trained ALIGNN checkpoint.
+
+    `state_dict` may come from either backend and `config` may be an
+    `ALIGNNConfig`. `mode` selects "eager", "script" (TorchScript)
+    or "compile" (`torch.compile`).
+    """
+    model = ALIGNN(config)
+    model.load_state_dict(state_dict)
+    module = ALIGNNInference(model).eval()
+    if mode == "script":
+        return torch.jit.script(module)
+    if mode == "compile":
+        return torch.compile(module, dynamic=True)
+    if mode != "eager":
+        raise ValueError("Unknown inference mode", mode)
+    return module
+
+
+def predict(
+    model: ALIGNN, structures: List, batch_size: int = 64, **graph_params
+) -> torch.Tensor:
+    """Predict a list of Atoms objects with a pure PyTorch ALIGNN."""
+    device = next(model.parameters()).device
+    out = []
+    with torch.no_grad():
+        for start in range(0, len(structures), batch_size):
+            graphs = [
+                atoms_to_graph(a, **graph_params)
+                for a in structures[start : start + batch_size]  # noqa:E203
+            ]
+            g = ALIGNNGraph(
+                *[
+                    x.to(device) if isinstance(x, torch.Tensor) else x
+                    for x in batch_graphs(graphs)
+                ]
+            )
+            out.append(model(g).view(len(graphs), -1))
+    return torch.cat(out)
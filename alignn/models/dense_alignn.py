@@ -15,7 +15,11 @@ from pydantic.typing import Literal
 from torch import nn
 from torch.nn import functional as F
 
-from alignn.models.utils import RBFExpansion
+from alignn.models.utils import (
+    RBFExpansion,
+    checkpoint_layer,
+    gate_denominator_input,
+)
 from alignn.utils import BaseSettings
 
 
@@ -37,6 +41,9 @@ class DenseALIGNNConfig(BaseSettings):
     # fc_features: int = 64
     output_features: int = 1
     norm: Literal["batchnorm", "layernorm"] = "layernorm"
+    # recompute dense block layer activations during backward
+    # instead of storing them (less memory, more compute)
+    checkpoint_layers: bool = False
 
     # if link == log, apply `exp` to final outputs
     # to constrain predictions to be positive
@@ -145,8 +152,10 @@ class EdgeGatedGraphConv(nn.Module):
         g.update_all(
             fn.u_mul_e("Bh", "sigma", "m"), fn.sum("m", "sum_sigma_h")
         )
-        g.update_all(fn.copy_e("sigma", "m"), fn.sum("m", "sum_sigma"))
-        g.ndata["h"] = g.ndata["sum_sigma_h"] / (g.ndata["sum_sigma"] + 1e-6)
+        sum_sigma = dgl.ops.copy_e_sum(
+            g, gate_denominator_input(g.edata["sigma"])
+        )
+        g.ndata["h"] = g.ndata["sum_sigma_h"] / (sum_sigma + 1e-6)
         x = self.src_update(x) + g.ndata.pop("h")
 
         if self.residual:
@@ -234,6 +243,56 @@ class MLPLayer(nn.Module):
         return x
 
 
+class _DenseAppend(torch.autograd.Function):
+    """Append feature map `x` to the `features` columns of `buffer`.
+
+    Returns the concatenation of both, as torch.cat([features, x], 1),
+    but as a view of the preallocated buffer.
+    """
+
+    @staticmethod
+    def forward(ctx, buffer, features, x):
+        """Copy `x` into the buffer, after `features`."""
+        start = features.shape[1]
+        stop = start + x.shape[1]
+        ctx.start, ctx.x_dtype = start, x.dtype
+        # write and view through .data, bypassing the shared version
+        # counter: filling later columns must not invalidate earlier
+        # views where layers saved them for backward
+        buffer.data[:, start:stop] = x
+        return buffer.data[:, :stop]
+
+    @staticmethod
+    def backward(ctx, grad):
+        """Split the gradient between `features` and `x`."""
+        start = ctx.start
+        return None, grad[:, :start], grad[:, start:].to(ctx.x_dtype)
+
+
+class DenseFeatureBuffer(object):
+    """Preallocated concatenation of dense block feature maps.
+
+    Each appended feature map is copied once into the next columns
+    of a buffer allocated for the whole block, and layers get views
+    of the buffer instead of a fresh torch.cat of all previous
+    feature maps, which are not kept alive by the block.
+    """
+
+    def __init__(self, x: torch.Tensor, width: int):
+        """Allocate a buffer of `width` columns starting with `x`."""
+        self.buffer = x.new_empty(x.shape[0], width)
+        self.features = self.buffer.data[:, :0]
+        self.append(x)
+
+    def append(self, x: torch.Tensor):
+        """Copy feature map `x` into the next buffer columns."""
+        self.features = _DenseAppend.apply(self.buffer, self.features, x)
+
+    def view(self) -> torch.Tensor:
+        """Get the concatenation of the appended feature maps."""
+        return self.features
+
+
 class DenseGCNBlock(nn.Module):
     """Dense block of gated graph convolution layers."""
 
@@ -245,10 +304,12 @@ class DenseGCNBlock(nn.Module):
         output_features: int = 32,
         residual: bool = True,
         norm=nn.BatchNorm1d,
+        checkpoint_layers: bool = False,
     ):
         """Densely-connected gated graph convolution layers."""
         super().__init__()
         self.residual = residual
+        self.checkpoint_layers = checkpoint_layers
         self.bottleneck_inputs = input_features + n_layers * growth_rate
         self.layers = nn.ModuleList()
 
@@ -279,14 +340,19 @@ class DenseGCNBlock(nn.Module):
         """Gated GCN updates: update node, edge features."""
         x_identity = x
         y_identity = y
-        xs, ys = [x], [y]
+        xs = DenseFeatureBuffer(x, self.bottleneck_inputs)
+        ys = DenseFeatureBuffer(y, self.bottleneck_inputs)
         for gcn_layer in self.layers:
-            new_x, new_y = gcn_layer(g, torch.cat(xs, 1), torch.cat(ys, 1))
+            x, y = xs.view(), ys.view()
+            if self.checkpoint_layers:
+                new_x, new_y = checkpoint_layer(gcn_layer, g, x, y)
+            else:
+                new_x, new_y = gcn_layer(g, x, y)
             xs.append(new_x)
             ys.append(new_y)
 
-        x = self.bottleneck_x(torch.cat(xs, 1))
-        y = self.bottleneck_y(torch.cat(ys, 1))
+        x = self.bottleneck_x(xs.view())
+        y = self.bottleneck_y(ys.view())
 
         if self.residual:
             x = x_identity + x
@@ -306,10 +372,13 @@ class DenseALIGNNBlock(nn.Module):
         output_features: int = 32,
         residual: bool = True,
         norm=nn.BatchNorm1d,
+        checkpoint_layers: bool = False,
     ):
         """Dense block of ALIGNN updates."""
         super().__init__()
         self.residual = residual
+        self.checkpoint_layers = checkpoint_layers
+        self.growth_rate = growth_rate
         self.bottleneck_inputs = input_features + n_layers * growth_rate
 
         self.layers = nn.ModuleList()
@@ -334,27 +403,33 @@ class DenseALIGNNBlock(nn.Module):
         """ALIGNN updates: update node, edge, triplet features.
 
         DenseNet style updates:
-        maintain a list of x, y, z features
-        and concatenate all previous feature maps
-        to form input for each layer
+        maintain buffers of x, y, z features
+        holding the concatenation of all previous feature maps
+        as input for each layer
         """
         x_identity = x
-        xs = [x]
+        xs = DenseFeatureBuffer(x, self.bottleneck_inputs)
         y_identity = y
-        ys = [y]
+        ys = DenseFeatureBuffer(y, self.bottleneck_inputs)
         # z_identity = z
-        zs = [z]
-
-        for alignn_layer in self.layers:
-            new_x, new_y, new_z = alignn_layer(
-                g, lg, torch.cat(xs, 1), torch.cat(ys, 1), torch.cat(zs, 1)
-            )
+        # the last layer's z is not used
+        zs = DenseFeatureBuffer(z, self.bottleneck_inputs - self.growth_rate)
+
+        for idx, alignn_layer in enumerate(self.layers):
+            x, y, z = xs.view(), ys.view(), zs.view()
+            if self.checkpoint_layers:
+                new_x, new_y, new_z = checkpoint_layer(
+                    alignn_layer, g, lg, x, y, z
+                )
+            else:
+                new_x, new_y, new_z = alignn_layer(g, lg, x, y, z)
             xs.append(new_x)
             ys.append(new_y)
-            zs.append(new_z)
+            if idx < len(self.layers) - 1:
+                zs.append(new_z)
 
-        x = self.bottleneck_x(torch.cat(xs, 1))
-        y = self.bottleneck_y(torch.cat(ys, 1))
+        x = self.bottleneck_x(xs.view())
+        y = self.bottleneck_y(ys.view())
 
         # residual connections around graph dense graph convolution block
         if self.residual:
@@ -419,6 +494,7 @@ class DenseALIGNN(nn.Module):
                 output_features=config.bottleneck_features,
                 residual=config.residual,
                 norm=norm,
+                checkpoint_layers=config.checkpoint_layers,
             )
         else:
             self.dense_alignn_block = None
@@ -431,6 +507,7 @@ class DenseALIGNN(nn.Module):
             output_features=config.bottleneck_features,
             residual=config.residual,
             norm=norm,
+            checkpoint_layers=config.checkpoint_layers,
         )
 
         self.readout = AvgPooling()
@@ -0,0 +1,136 @@
+"""Fold eval-mode BatchNorm layers into neighbouring linear layers.
+
+At inference time BatchNorm1d is a fixed per-channel affine map
+y = scale * x + shift, so whenever it directly follows a linear
+projection (possibly through sums of linear projections and linear
+aggregations) it can be absorbed into the projection weights:
+
+- `Linear -> BatchNorm1d` in `nn.Sequential` / `nn.ModuleDict`
+  containers (`MLPLayer`, `CGCNNConvFull`),
+- `bn_nodes` of the ALIGNN `EdgeGatedGraphConv`, which normalizes
+  src_update(x) + sum_j sigma_ij dst_update(x_j) / sum_j sigma_ij,
+- `bn_message` of `ACGCNNConv` and `CGCNNConv`, which normalizes
+  linear_src(x_i) + linear_dst(x_j) + linear_edge(e_ij).
+
+Folded norms are replaced by `nn.Identity`, so the fused model keeps
+its classes and forward code but not its BatchNorm state_dict
+entries; it is meant for serving, not for further training.
+
+The remaining norms are left in place: `bn_edges` in ALIGNN (its
+input m also drives the sigmoid gates, so scaling m would change
+them), the final `bn` of CGCNN layers (it follows a sum of nonlinear
+messages) and the pre-activation norms of DenseALIGNN.
+
+`quantize_for_inference` further converts the linear layers to
+dynamic int8 (CPU only): weights are stored as int8 and activations
+are quantized per batch, while gates, aggregations, norms and
+activations stay in float32.
+"""
+import copy
+from typing import Optional
+
+import torch
+from torch import nn
+
+from alignn.models import alignn, alignn_cgcnn, alignn_torch, modified_cgcnn
+
+_EDGE_GATED_CONVS = (
+    alignn.EdgeGatedGraphConv,
+    alignn_torch.EdgeGatedGraphConv,
+)
+_CGCNN_CONVS = (alignn_cgcnn.ACGCNNConv, modified_cgcnn.CGCNNConv)
+
+
+def _foldable(bn: nn.Module) -> bool:
+    """Check for a BatchNorm1d that normalizes with running statistics."""
+    return isinstance(bn, nn.BatchNorm1d) and bn.running_mean is not None
+
+
+def batchnorm_affine(bn: nn.BatchNorm1d):
+    """Get per-channel scale and shift of an eval-mode BatchNorm."""
+    scale = torch.rsqrt(bn.running_var + bn.eps)
+    shift = -bn.running_mean * scale
+    if bn.affine:
+        scale = scale * bn.weight
+        shift = shift * bn.weight + bn.bias
+    return scale.detach(), shift.detach()
+
+
+@torch.no_grad()
+def fold_affine(
+    linear: nn.Linear, scale: torch.Tensor, shift: Optional[torch.Tensor]
+):
+    """Replace `linear` by scale * linear(x) + shift, in place."""
+    linear.weight.mul_(scale[:, None])
+    if linear.bias is not None:
+        linear.bias.mul_(scale)
+    if shift is None:
+        return
+    if linear.bias is None:
+        linear.bias = nn.Parameter(torch.zeros_like(shift))
+    linear.bias.add_(shift)
+
+
+def _fuse_container(module: nn.Module):
+    """Fold consecutive Linear -> BatchNorm1d children of a container."""
+    children = list(module.named_children())
+    for (_, linear), (name, bn) in zip(children, children[1:]):
+        if isinstance(linear, nn.Linear) and _foldable(bn):
+            fold_affine(linear, *batchnorm_affine(bn))
+            setattr(module, name, nn.Identity())
+
+
+def fuse_for_inference(model: nn.Module, inplace: bool = False) -> nn.Module:
+    """Fold eval-mode BatchNorm statistics into linear projections.
+
+    Works on `ALIGNN` (DGL and PyTorch backends), `DenseALIGNN`,
+    `ACGCNN` and `CGCNN`; the result is in eval mode.
+    """
+    if not inplace:
+        model = copy.deepcopy(model)
+    model.eval()
+    for module in list(model.modules()):
+        if isinstance(module, (nn.Sequential, nn.ModuleDict)):
+            _fuse_container(module)
+        elif isinstance(module, _EDGE_GATED_CONVS) and _foldable(
+            module.bn_nodes
+        ):
+            # the gated mean of dst_update is linear in dst_update
+            scale, shift = batchnorm_affine(module.bn_nodes)
+            fold_affine(module.src_update, scale, shift)
+            fold_affine(module.dst_update, scale, None)
+            module.bn_nodes = nn.Identity()
+        elif isinstance(module, _CGCNN_CONVS) and _foldable(
+            module.bn_message
+        ):
+            scale, shift = batchnorm_affine(module.bn_message)
+            fold_affine(module.linear_src, scale, None)
+            fold_affine(module.linear_dst, scale, None)
+            fold_affine(module.linear_edge, scale, shift)
+            module.bn_message = nn.Identity()
+    return model
+
+
+def quantize_for_inference(
+    model: nn.Module, inplace: bool = False
+) -> nn.Module:
+    """Fold BatchNorm layers, then quantize linear layers to dynamic int8.
+
+    Linear layers of `FusedEdgeGatedGraphConv` are kept in float32,
+    as its forward reads their weights directly.
+    """
+    model = fuse_for_inference(model, inplace=inplace).cpu()
+    fused = [
+        name
+        for name, m in model.named_modules()
+        if isinstance(m, alignn.FusedEdgeGatedGraphConv)
+    ]
+    linears = {
+        name
+        for name, m in model.named_modules()
+        if isinstance(m, nn.Linear)
+        and not any(name.startswith(f + ".") for f in fused)
+    }
+    return torch.ao.quantization.quantize_dynamic(
+        model, linears, dtype=torch.qint8, inplace=True
+    )
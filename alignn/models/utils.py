@@ -1,9 +1,12 @@
 """Shared model-building components."""
+from contextlib import contextmanager, nullcontext
+from functools import partial
 from typing import Optional
 
 import numpy as np
 import torch
 from torch import nn
+from torch.utils.checkpoint import checkpoint
 
 
 class RBFExpansion(nn.Module):
@@ -40,3 +43,58 @@ class RBFExpansion(nn.Module):
         return torch.exp(
             -self.gamma * (distance.unsqueeze(1) - self.centers) ** 2
         )
+
+
+def gate_denominator_input(sigma: torch.Tensor) -> torch.Tensor:
+    """Edge gates to sum for the gate denominator.
+
+    Half precision gates (bf16/fp16, e.g. under autocast) are summed in
+    float32; float32 and float64 gates keep their dtype.
+    """
+    if sigma.dtype == torch.bfloat16 or sigma.dtype == torch.float16:
+        return sigma.float()
+    return sigma
+
+
+@contextmanager
+def _restore_norm_statistics(module: nn.Module):
+    """Undo BatchNorm running statistics updates made in this context."""
+    buffers = [
+        (b, b.clone())
+        for m in module.modules()
+        if isinstance(m, nn.modules.batchnorm._BatchNorm)
+        for b in m.buffers()
+    ]
+    try:
+        yield
+    finally:
+        with torch.no_grad():
+            for b, saved in buffers:
+                b.copy_(saved)
+
+
+def _checkpoint_contexts(module: nn.Module):
+    """Get forward and recomputation contexts for `checkpoint_layer`."""
+    return nullcontext(), _restore_norm_statistics(module)
+
+
+def checkpoint_layer(layer: nn.Module, *args):
+    """Call `layer`, recomputing its activations during backward.
+
+    Only the inputs of `layer` are kept for backward. BatchNorm
+    running statistics are restored after the recomputation, so they
+    are updated once per training step.
+    """
+    if not torch.is_grad_enabled():
+        return layer(*args)
+    version = tuple(int(v) for v in torch.__version__.split(".")[:2])
+    if version < (2, 1):
+        raise RuntimeError(
+            "checkpoint_layers needs torch>=2.1, found " + torch.__version__
+        )
+    return checkpoint(
+        layer,
+        *args,
+        use_reentrant=False,
+        context_fn=partial(_checkpoint_contexts, layer),
+    )
@@ -0,0 +1,144 @@
+"""Vectorized periodic neighbor search for crystal graph construction.
+
+NumPy implementation of the k-nearest neighbor edge construction in
+`jarvis.core.graphs`: periodic images are searched in one batched
+distance computation instead of per-atom Python loops.
+The resulting edge set is identical to the jarvis implementation
+for both the plain and the canonized (`use_canonize`) edge schemes.
+"""
+import numpy as np
+
+
+def _lattice_images(atoms, r: float = 5, bond_tol: float = 0.15):
+    """Enumerate periodic images that can contain neighbors within `r`.
+
+    Same image ranges and ordering as `Atoms.get_all_neighbors`.
+    """
+    recp_len = np.array(atoms.lattice.reciprocal_lattice().abc)
+    maxr = np.ceil((r + bond_tol) * recp_len / (2 * np.pi))
+    frac_coords = np.asarray(atoms.frac_coords, dtype=float)
+    nmin = np.floor(np.min(frac_coords, axis=0)) - maxr
+    nmax = np.ceil(np.max(frac_coords, axis=0)) + maxr
+    ranges = [np.arange(x, y) for x, y in zip(nmin, nmax)]
+
+    # C-ordered meshgrid matches itertools.product over the ranges
+    grid = np.meshgrid(*ranges, indexing="ij")
+    return np.stack([x.ravel() for x in grid], axis=1)
+
+
+def get_all_neighbors(
+    atoms, r: float = 5, bond_tol: float = 0.15, block_size: int = 2 ** 20
+):
+    """Get neighbors for each atom in the unit cell, out to a distance r.
+
+    Returns flat arrays (site, neighbor, image, distance).
+    Within each site, neighbors follow the same order as
+    `jarvis.core.atoms.Atoms.get_all_neighbors`.
+
+    `block_size` bounds the number of pairwise distances held in memory.
+    """
+    images = _lattice_images(atoms, r=r, bond_tol=bond_tol)
+    coords = np.asarray(atoms.cart_coords, dtype=float)
+    n_atoms = len(coords)
+    shifts = np.dot(images, np.asarray(atoms.lattice_mat, dtype=float))
+
+    step = max(1, block_size // max(1, n_atoms * n_atoms))
+    sites, neighbors, image_ids, distances = [], [], [], []
+    for start in range(0, len(images), step):
+        # image_coords[b, j]: atom j translated by image b
+        block = shifts[start : start + step]  # noqa:E203
+        image_coords = block[:, None, :] + coords
+        z = (image_coords[:, :, None, :] - coords[None, None, :, :]) ** 2
+        all_dists = np.sum(z, axis=-1) ** 0.5
+        within_r = (all_dists <= r) & (all_dists > 1e-8)
+        within_r &= all_dists > bond_tol
+
+        # nonzero is row-major: (image, neighbor, site) ordering
+        b, j, i = np.nonzero(within_r)
+        sites.append(i)
+        neighbors.append(j)
+        image_ids.append(b + start)
+        distances.append(all_dists[b, j, i])
+
+    image_ids = np.concatenate(image_ids)
+    return (
+        np.concatenate(sites),
+        np.concatenate(neighbors),
+        images[image_ids],
+        np.concatenate(distances),
+    )
+
+
+def nearest_neighbor_edges(
+    atoms=None,
+    cutoff: float = 8,
+    max_neighbors: int = 12,
+    use_canonize: bool = False,
+):
+    """Construct k-NN edge list.
+
+    Returns (src_id, dst_id, dst_image) arrays, one row per
+    unique cell-resolved edge.
+    """
+    n_atoms = len(atoms.elements)
+    sites, neighbors, images, distances = get_all_neighbors(atoms, r=cutoff)
+
+    # if a site has too few neighbors, increase the cutoff radius
+    n_neighbors = np.bincount(sites, minlength=n_atoms)
+    if n_neighbors.min() < max_neighbors:
+        lat = atoms.lattice
+        if cutoff < max(lat.a, lat.b, lat.c):
+            r_cut = max(lat.a, lat.b, lat.c)
+        else:
+            r_cut = 2 * cutoff
+        return nearest_neighbor_edges(
+            atoms=atoms,
+            cutoff=r_cut,
+            max_neighbors=max_neighbors,
+            use_canonize=use_canonize,
+        )
+
+    # stable sort on (site, distance)
+    order = np.lexsort((distances, sites))
+    sites = sites[order]
+    neighbors = neighbors[order]
+    images = images[order]
+    distances = distances[order]
+
+    # keep all edges out to the neighbor shell of the k-th neighbor
+    offsets = np.concatenate([[0], np.cumsum(n_neighbors)[:-1]])
+    max_dist = distances[offsets + max_neighbors - 1]
+    keep = distances <= max_dist[sites]
+    src = sites[keep]
+    dst = neighbors[keep]
+    images = np.rint(images[keep]).astype(int)
+
+    if use_canonize:
+        # store directed edges src_id <= dst_id
+        # and shift periodic images so src is in the (0,0,0) image
+        swap = dst < src
+        src, dst = np.where(swap, dst, src), np.where(swap, src, dst)
+        images = np.where(swap[:, None], -images, images)
+
+    edges = np.unique(np.column_stack([src, dst, images]), axis=0)
+    return edges[:, 0], edges[:, 1], edges[:, 2:]
+
+
+def build_undirected_edgedata(atoms=None, src=None, dst=None, images=None):
+    """Build undirected graph data from cell-resolved edges.
+
+    Returns (u, v, r) arrays with both directions of every edge,
+    where r is the cartesian displacement vector from u -> v.
+    """
+    frac_coords = np.asarray(atoms.frac_coords, dtype=float)
+    lattice_mat = np.asarray(atoms.lattice_mat, dtype=float)
+
+    # cartesian displacement vector pointing from src -> dst image
+    d = np.dot(frac_coords[dst] + images - frac_coords[src], lattice_mat)
+
+    # add edges for both directions
+    u = np.stack([src, dst], axis=1).reshape(-1)
+    v = np.stack([dst, src], axis=1).reshape(-1)
+    r = np.stack([d, -d], axis=1).reshape(-1, 3)
+
+    return u, v, r
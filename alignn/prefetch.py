@@ -0,0 +1,91 @@
+"""Background batch prefetching for the training loop."""
+import queue
+import threading
+from typing import Callable, Iterable
+
+import torch
+
+_DONE = object()
+
+
+class _Failure(object):
+    """Exception raised in the prefetch thread."""
+
+    def __init__(self, exception: BaseException):
+        """Wrap an exception for re-raising in the consumer."""
+        self.exception = exception
+
+
+def prepared_batch(batch, device=None, non_blocking=False):
+    """Pass through a batch already prepared by `PrefetchLoader`."""
+    return batch
+
+
+class PrefetchLoader(object):
+    """Iterate over a loader with batches prepared ahead of time.
+
+    A background thread pulls batches from `loader` and applies
+    `prepare_batch` (e.g. moving graphs and targets to the device),
+    keeping up to `n_prefetch` prepared batches in a bounded queue
+    while the current step runs. Use `prepared_batch` as
+    the `prepare_batch` of the ignite engines consuming it.
+    """
+
+    def __init__(
+        self,
+        loader: Iterable,
+        prepare_batch: Callable,
+        n_prefetch: int = 2,
+    ):
+        """Wrap `loader`."""
+        self.loader = loader
+        self.prepare_batch = prepare_batch
+        self.n_prefetch = n_prefetch
+
+    def __len__(self):
+        """Get number of batches."""
+        return len(self.loader)
+
+    def _produce(self, q: queue.Queue, stop: threading.Event):
+        """Prepare batches into `q` until exhausted or stopped."""
+
+        def put(x):
+            while not stop.is_set():
+                try:
+                    q.put(x, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            for batch in self.loader:
+                with torch.profiler.record_function("prefetch_batch"):
+                    batch = self.prepare_batch(batch, non_blocking=True)
+                if not put(batch):
+                    return
+        except BaseException as exp:
+            put(_Failure(exp))
+            return
+        put(_DONE)
+
+    def __iter__(self):
+        """Yield prepared batches."""
+        q = queue.Queue(maxsize=max(1, self.n_prefetch))
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._produce, args=(q, stop), daemon=True
+        )
+        thread.start()
+        try:
+            while True:
+                batch = q.get()
+                if batch is _DONE:
+                    break
+                if isinstance(batch, _Failure):
+                    raise batch.exception
+                yield batch
+        finally:
+            # also reached when the consumer stops early
+            stop.set()
+            thread.join()
@@ -6,6 +6,7 @@ import os
 import zipfile
 from tqdm import tqdm
 from alignn.models.alignn import ALIGNN, ALIGNNConfig
+from alignn.models.fusion import fuse_for_inference, quantize_for_inference
 from alignn.data import get_torch_dataset
 from torch.utils.data import DataLoader
 import tempfile
@@ -14,8 +15,9 @@ import sys
 
 # from jarvis.db.jsonutils import loadjson
 import argparse
+import dgl
 from jarvis.core.atoms import Atoms
-from jarvis.core.graphs import Graph
+from alignn.graphs import atom_dgl_multigraph
 from jarvis.db.jsonutils import dumpjson
 import pandas as pd
 
@@ -176,8 +178,15 @@ def get_all_models():
     return all_models
 
 
-def get_figshare_model(model_name="jv_formation_energy_peratom_alignn"):
-    """Get ALIGNN torch models from figshare."""
+def get_figshare_model(
+    model_name="jv_formation_energy_peratom_alignn", fuse=False, quantize=False
+):
+    """Get ALIGNN torch models from figshare.
+
+    With `fuse`, BatchNorm layers are folded into the linear layers
+    for inference; `quantize` also converts the linear layers to
+    dynamic int8 on CPU (see `alignn.models.fusion`).
+    """
     # https://figshare.com/projects/ALIGNN_models/126478
 
     tmp = all_models[model_name]
@@ -219,6 +228,10 @@ def get_figshare_model(model_name="jv_formation_energy_peratom_alignn"):
     model.eval()
     if os.path.exists(filename):
         os.remove(filename)
+    if quantize:
+        model = quantize_for_inference(model, inplace=True)
+    elif fuse:
+        model = fuse_for_inference(model, inplace=True)
     return model
 
 
@@ -228,9 +241,9 @@ def get_prediction(
     cutoff=8,
 ):
     """Get model prediction on a single structure."""
-    model = get_figshare_model(model_name)
+    model = get_figshare_model(model_name, fuse=True)
     # print("Loading completed.")
-    g, lg = Graph.atom_dgl_multigraph(atoms, cutoff=float(cutoff))
+    g, lg = atom_dgl_multigraph(atoms, cutoff=float(cutoff))
     out_data = (
         model([g.to(device), lg.to(device)])
         .detach()
@@ -260,8 +273,13 @@ def get_multiple_predictions(
     model=None,
     model_name="jv_formation_energy_peratom_alignn",
     print_freq=100,
+    quantize=False,
 ):
-    """Use pretrained model on a number of structures."""
+    """Use pretrained model on a number of structures.
+
+    With `quantize`, the model runs with dynamic int8 linear layers
+    on CPU.
+    """
     # import glob
     # atoms_array=[]
     # for i in glob.glob("alignn/examples/sample_data/*.vasp"):
@@ -279,18 +297,23 @@ def get_multiple_predictions(
 
     if model is None:
         try:
-            model = get_figshare_model(model_name)
+            model = get_figshare_model(
+                model_name, fuse=True, quantize=quantize
+            )
         except Exception as exp:
             raise ValueError(
                 'Check is the model name exists using "pretrained.py -h"', exp
             )
             pass
+    elif quantize:
+        model = quantize_for_inference(model)
+    model_device = "cpu" if quantize else device
 
     # Note cut-off is usually 8 for solids and 5 for molecules
     def atoms_to_graph(atoms):
         """Convert structure dict to DGLGraph."""
         structure = Atoms.from_dict(atoms)
-        return Graph.atom_dgl_multigraph(
+        return atom_dgl_multigraph(
             structure,
             cutoff=cutoff,
             atom_features="atomic_number",
@@ -324,7 +347,7 @@ def get_multiple_predictions(
         ids = test_loader.dataset.ids
         for dat, id in zip(test_loader, ids):
             g, lg, target = dat
-            out_data = model([g.to(device), lg.to(device)])
+            out_data = model([g.to(model_device), lg.to(model_device)])
             out_data = out_data.cpu().numpy().tolist()
             target = target.cpu().numpy().flatten().tolist()
             info = {}
@@ -349,6 +372,84 @@ def get_multiple_predictions(
     dumpjson(data=save, filename=filename)
 
 
+def _property_columns(name, n_outputs):
+    """Get DataFrame columns of the outputs of model `name`."""
+    if n_outputs == 1:
+        return [name]
+    return ["%s_%d" % (name, k) for k in range(n_outputs)]
+
+
+def get_multiple_properties(
+    atoms_array=None,
+    model_names=None,
+    models=None,
+    ids=None,
+    cutoff=8,
+    max_neighbors=12,
+    use_canonize=True,
+    batch_size=64,
+    quantize=False,
+):
+    """Predict many properties of many structures in a single pass.
+
+    Graphs and line graphs are built and batched once; every model in
+    `model_names` (default: all pretrained models), or in `models`
+    ({name: model}, if already loaded), then runs on the shared
+    batches. Returns a DataFrame with one row per structure (index:
+    `ids`) and one column per property; multi-output models give
+    columns `<name>_<i>`. Without structures, the DataFrame is empty
+    and no pretrained model is downloaded.
+    """
+    if atoms_array is None:
+        atoms_array = []
+    if model_names is None:
+        model_names = list(all_models)
+    if len(atoms_array) == 0:
+        if models is None:
+            widths = {name: all_models[name][1] for name in model_names}
+        else:
+            widths = {name: m.fc.out_features for name, m in models.items()}
+        columns = [
+            c for name, n in widths.items() for c in _property_columns(name, n)
+        ]
+        return pd.DataFrame(columns=columns, index=ids, dtype=float)
+    if models is None:
+        models = (
+            (name, get_figshare_model(name, fuse=True, quantize=quantize))
+            for name in model_names
+        )
+    else:
+        models = models.items()
+    model_device = "cpu" if quantize else device
+
+    batches = []
+    for i in range(0, len(atoms_array), batch_size):
+        graphs = [
+            atom_dgl_multigraph(
+                atoms,
+                cutoff=float(cutoff),
+                max_neighbors=max_neighbors,
+                use_canonize=use_canonize,
+            )
+            for atoms in atoms_array[i : i + batch_size]  # noqa:E203
+        ]
+        g, lg = (dgl.batch(list(x)).to(model_device) for x in zip(*graphs))
+        batches.append((g, lg))
+
+    properties = {}
+    # models are loaded (and released) one at a time
+    for name, model in models:
+        with torch.no_grad():
+            out = torch.cat(
+                [
+                    model([g, lg]).reshape(g.batch_size, -1).cpu()
+                    for g, lg in batches
+                ]
+            ).numpy()
+        properties.update(zip(_property_columns(name, out.shape[1]), out.T))
+    return pd.DataFrame(properties, index=ids)
+
+
 if __name__ == "__main__":
     args = parser.parse_args(sys.argv[1:])
     model_name = args.model_name
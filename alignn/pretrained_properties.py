@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""Predict many pretrained properties of many structures at once.
+
+e.g. `python alignn/pretrained_properties.py --file_paths a.vasp b.vasp
+--model_names jv_formation_energy_peratom_alignn jv_mbj_bandgap_alignn`
+writes a structure x property table to `--output`.
+"""
+import argparse
+import sys
+
+from alignn.data import read_structures
+from alignn.pretrained import all_models, get_multiple_properties
+
+parser = argparse.ArgumentParser(
+    description="Atomistic Line Graph Neural Network Pretrained Properties"
+)
+parser.add_argument(
+    "--file_paths", nargs="+", required=True, help="Structure files."
+)
+parser.add_argument(
+    "--file_format", default="poscar", help="poscar/cif/xyz/pdb file format."
+)
+parser.add_argument(
+    "--model_names",
+    nargs="+",
+    default=list(all_models),
+    help="Pretrained models (default: all): " + ", ".join(all_models),
+)
+parser.add_argument(
+    "--cutoff",
+    type=float,
+    default=8,
+    help="Distance cut-off for graph constuction"
+    + ", usually 8 for solids and 5 for molecules.",
+)
+parser.add_argument("--max_neighbors", type=int, default=12)
+parser.add_argument("--batch_size", type=int, default=64)
+parser.add_argument(
+    "--workers", type=int, default=0, help="Processes for file parsing."
+)
+parser.add_argument(
+    "--quantize",
+    action="store_true",
+    help="Run the models with dynamic int8 linear layers on CPU.",
+)
+parser.add_argument(
+    "--output", default="properties.csv", help="CSV file for predictions."
+)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args(sys.argv[1:])
+    for name in args.model_names:
+        if name not in all_models:
+            raise ValueError("Unknown pretrained model", name)
+    structures = read_structures(
+        args.file_paths, args.file_format, workers=args.workers
+    )
+    df = get_multiple_properties(
+        atoms_array=structures,
+        model_names=args.model_names,
+        ids=args.file_paths,
+        cutoff=args.cutoff,
+        max_neighbors=args.max_neighbors,
+        batch_size=args.batch_size,
+        quantize=args.quantize,
+    )
+    df.to_csv(args.output, index_label="file_path")
+    print(df)
@@ -0,0 +1,166 @@
+"""Batch samplers packing crystal graphs by size."""
+from typing import Iterator, List, Optional
+
+import numpy as np
+import torch
+from torch.utils.data import BatchSampler
+
+
+def pack_batches(
+    sizes: np.ndarray,
+    order: np.ndarray,
+    budget: np.ndarray,
+) -> List[List[int]]:
+    """Greedily pack structures in `order` into batches within `budget`.
+
+    `sizes` holds (nodes, edges, triplets) per structure and `budget`
+    the per-batch maximum of each; a structure exceeding the budget
+    on its own forms a single-structure batch.
+    """
+    batches, batch = [], []
+    total = np.zeros(sizes.shape[1], dtype=np.int64)
+    for idx in order:
+        size = sizes[idx]
+        if batch and np.any(total + size > budget):
+            batches.append(batch)
+            batch = []
+            total[:] = 0
+        batch.append(int(idx))
+        total += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class BudgetBatchSampler(BatchSampler):
+    """Batch sampler with a node/edge/triplet budget per batch.
+
+    Structures are reshuffled every epoch (if `shuffle`) and packed
+    greedily until the next one would exceed any of the budgets,
+    so the number of batches may vary slightly between epochs;
+    `len()` reports the packing of the upcoming epoch.
+    """
+
+    def __init__(
+        self,
+        sizes: np.ndarray,
+        max_nodes: Optional[int] = None,
+        max_edges: Optional[int] = None,
+        max_triplets: Optional[int] = None,
+        shuffle: bool = True,
+        seed: int = 123,
+    ):
+        """Set up packing for per-structure (nodes, edges, triplets)."""
+        # BatchSampler attributes, e.g. for ignite's deterministic engine
+        self.sampler = None
+        self.batch_size = None
+        self.drop_last = False
+        self.sizes = np.asarray(sizes, dtype=np.int64).reshape(-1, 3)
+        inf = np.iinfo(np.int64).max
+        self.budget = np.array(
+            [
+                inf if x is None else x
+                for x in (max_nodes, max_edges, max_triplets)
+            ]
+        )
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self._batches = None
+
+    def set_epoch(self, epoch: int):
+        """Select the shuffle of a given epoch."""
+        self.epoch = epoch
+        self._batches = None
+
+    def _order(self):
+        """Get structure order for the current epoch."""
+        if not self.shuffle:
+            return np.arange(len(self.sizes))
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        return torch.randperm(len(self.sizes), generator=g).numpy()
+
+    def batches(self) -> List[List[int]]:
+        """Get the packed batches of the current epoch."""
+        if self._batches is None:
+            self._batches = pack_batches(
+                self.sizes, self._order(), self.budget
+            )
+        return self._batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        """Yield batches of the current epoch, then advance the epoch."""
+        batches = self.batches()
+        self.set_epoch(self.epoch + 1)
+        return iter(batches)
+
+    def __len__(self):
+        """Get number of batches in the current epoch."""
+        return len(self.batches())
+
+
+class BucketBatchSampler(BudgetBatchSampler):
+    """Batch sampler grouping structures of similar size.
+
+    Structures are sorted by atom and triplet counts (ties broken
+    randomly each epoch) and cut into batches of `batch_size`,
+    or, without `batch_size`, packed up to the size budget,
+    so that the work per batch is roughly uniform.
+    The order of the batches is reshuffled every epoch.
+    """
+
+    def __init__(
+        self,
+        sizes: np.ndarray,
+        batch_size: Optional[int] = None,
+        max_nodes: Optional[int] = None,
+        max_edges: Optional[int] = None,
+        max_triplets: Optional[int] = None,
+        shuffle: bool = True,
+        drop_last: bool = False,
+        seed: int = 123,
+    ):
+        """Set up bucketing for per-structure (nodes, edges, triplets)."""
+        super().__init__(
+            sizes,
+            max_nodes=max_nodes,
+            max_edges=max_edges,
+            max_triplets=max_triplets,
+            shuffle=shuffle,
+            seed=seed,
+        )
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+
+    def batches(self) -> List[List[int]]:
+        """Get the bucketed batches of the current epoch."""
+        if self._batches is not None:
+            return self._batches
+
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.epoch)
+        order = self._order()
+        if self.batch_size is not None and self.drop_last:
+            # drop a random remainder rather than the largest structures
+            order = order[: len(order) - len(order) % self.batch_size]
+
+        noise = np.zeros(len(order))
+        if self.shuffle:
+            noise = torch.rand(len(order), generator=g).numpy()
+        sizes = self.sizes[order]
+        order = order[np.lexsort((noise, sizes[:, 2], sizes[:, 0]))]
+
+        if self.batch_size is not None:
+            batches = [
+                order[start : start + self.batch_size].tolist()  # noqa:E203
+                for start in range(0, len(order), self.batch_size)
+            ]
+        else:
+            batches = pack_batches(self.sizes, order, self.budget)
+
+        if self.shuffle:
+            perm = torch.randperm(len(batches), generator=g).tolist()
+            batches = [batches[i] for i in perm]
+        self._batches = batches
+        return batches
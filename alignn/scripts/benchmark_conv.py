@@ -0,0 +1,111 @@
+"""Benchmark FusedEdgeGatedGraphConv against EdgeGatedGraphConv.
+
+Times one layer on a batch of crystal graphs and on the batch of
+their line graphs (forward in eval mode, forward and backward in
+train mode), after checking that both layers agree with the same
+parameters.
+
+Run from the repository root, e.g.
+`python -m alignn.scripts.benchmark_conv --batch_size 64`
+"""
+import argparse
+import csv
+import os
+import statistics
+import tempfile
+import time
+
+import torch
+from jarvis.core.atoms import Atoms
+
+from alignn.data import get_torch_dataset
+from alignn.models.alignn import EdgeGatedGraphConv, FusedEdgeGatedGraphConv
+
+parser = argparse.ArgumentParser(description="Graph convolution benchmark.")
+parser.add_argument(
+    "--root_dir",
+    default=os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), "examples", "sample_data"
+    ),
+    help="Folder with id_prop.csv and structure files",
+)
+parser.add_argument("--batch_size", type=int, default=64)
+parser.add_argument("--hidden_features", type=int, default=256)
+parser.add_argument("--repeats", type=int, default=20)
+
+
+def time_layer(layers, g, x, y, train=False, repeats=20):
+    """Get median time per call of each layer, interleaving runs."""
+    times = [[] for _ in layers]
+    for _ in range(repeats + 1):
+        for layer, t in zip(layers, times):
+            layer.train(train)
+            t0 = time.perf_counter()
+            if train:
+                xi = x.clone().requires_grad_()
+                yi = y.clone().requires_grad_()
+                out = layer(g, xi, yi)
+                (out[0].sum() + out[1].sum()).backward()
+            else:
+                with torch.no_grad():
+                    layer(g, x, y)
+            t.append(time.perf_counter() - t0)
+    # the first call is warm-up
+    return [statistics.median(t[1:]) for t in times]
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    with open(os.path.join(args.root_dir, "id_prop.csv"), "r") as f:
+        rows = [row for row in csv.reader(f)]
+    dataset = [
+        {
+            "jid": name,
+            "atoms": Atoms.from_poscar(os.path.join(args.root_dir, name)),
+            "target": float(target),
+        }
+        for name, target in rows
+    ]
+    data = get_torch_dataset(
+        dataset=dataset,
+        target="target",
+        neighbor_strategy="k-nearest",
+        atom_features="cgcnn",
+        use_canonize=True,
+        line_graph=True,
+        output_dir=tempfile.mkdtemp(),
+    )
+    samples = [data[i % len(data)] for i in range(args.batch_size)]
+    g, lg, _ = data.collate_line_graph(samples)
+
+    features = args.hidden_features
+    reference = EdgeGatedGraphConv(features, features)
+    fused = FusedEdgeGatedGraphConv(features, features)
+    fused.load_state_dict(reference.state_dict())
+
+    print("batch size:", args.batch_size, "features:", features)
+    for name, graph in [("crystal graph", g), ("line graph", lg)]:
+        x = torch.randn(graph.num_nodes(), features)
+        y = torch.randn(graph.num_edges(), features)
+        for layer in (reference, fused):
+            layer.eval()
+        with torch.no_grad():
+            a, b = reference(graph, x, y), fused(graph, x, y)
+        assert all(torch.allclose(u, v, atol=1e-5) for u, v in zip(a, b))
+
+        print(
+            name,
+            "nodes:",
+            graph.num_nodes(),
+            "edges:",
+            graph.num_edges(),
+        )
+        for train in (False, True):
+            t_ref, t_fused = time_layer(
+                [reference, fused], graph, x, y, train, args.repeats
+            )
+            mode = "forward+backward" if train else "forward"
+            print(
+                "  %s (ms/layer): reference %.3f fused %.3f speedup %.2fx"
+                % (mode, 1e3 * t_ref, 1e3 * t_fused, t_ref / t_fused)
+            )
@@ -0,0 +1,123 @@
+"""Benchmark eager against compiled ALIGNN inference.
+
+Times batched predictions on the sample data for
+- the DGL ALIGNN model,
+- the pure PyTorch backend, eager,
+- `ALIGNNInference` compiled with TorchScript,
+- `ALIGNNInference` compiled with `torch.compile`,
+after checking that all of them agree.
+
+Run from the repository root, e.g.
+`python -m alignn.scripts.benchmark_inference --batch_size 16`
+"""
+import argparse
+import os
+import statistics
+import time
+
+import dgl
+import torch
+from jarvis.core.atoms import Atoms
+
+from alignn.models import alignn_torch
+from alignn.models.alignn import ALIGNN, ALIGNNConfig
+
+parser = argparse.ArgumentParser(description="Inference benchmark.")
+parser.add_argument(
+    "--root_dir",
+    default=os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), "examples", "sample_data"
+    ),
+    help="Folder with id_prop.csv and structure files",
+)
+parser.add_argument("--batch_size", type=int, default=16)
+parser.add_argument("--repeats", type=int, default=10)
+parser.add_argument(
+    "--checkpoint", default=None, help="ALIGNN state_dict (default: random)"
+)
+
+
+def dgl_graphs(g: alignn_torch.ALIGNNGraph):
+    """Convert a batch to a DGL crystal graph and line graph."""
+    cg = dgl.graph((g.src, g.dst), num_nodes=len(g.atom_features))
+    cg.ndata["atom_features"] = g.atom_features
+    cg.edata["r"] = g.r
+    cg.set_batch_num_nodes(torch.bincount(g.graph_index))
+    lg = dgl.graph((g.lg_src, g.lg_dst), num_nodes=len(g.src))
+    lg.edata["h"] = g.h
+    return cg, lg
+
+
+def median_time(fn, batches, repeats=10):
+    """Get median time of `fn` over all batches, after one warm-up pass."""
+    with torch.no_grad():
+        for batch in batches:
+            fn(batch)
+        times = []
+        for _ in range(repeats):
+            t0 = time.perf_counter()
+            for batch in batches:
+                fn(batch)
+            times.append((time.perf_counter() - t0) / len(batches))
+    return statistics.median(times)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    with open(os.path.join(args.root_dir, "id_prop.csv"), "r") as f:
+        names = [line.split(",")[0] for line in f if line.strip()]
+    graphs = [
+        alignn_torch.atoms_to_graph(
+            Atoms.from_poscar(os.path.join(args.root_dir, name)),
+            use_canonize=True,
+        )
+        for name in names
+    ]
+    batches = [
+        alignn_torch.batch_graphs(graphs[i : i + args.batch_size])  # noqa:E203
+        for i in range(0, len(graphs), args.batch_size)
+    ]
+    inputs = [alignn_torch.inference_inputs(g) for g in batches]
+
+    config = ALIGNNConfig(name="alignn")
+    model = ALIGNN(config)
+    if args.checkpoint is not None:
+        model.load_state_dict(torch.load(args.checkpoint, map_location="cpu"))
+    model.eval()
+    state_dict = model.state_dict()
+
+    t0 = time.perf_counter()
+    eager = alignn_torch.inference_model(state_dict, config, mode="eager")
+    scripted = alignn_torch.inference_model(state_dict, config, mode="script")
+    t_script = time.perf_counter() - t0
+    compiled = alignn_torch.inference_model(
+        state_dict, config, mode="compile"
+    )
+    t0 = time.perf_counter()
+    with torch.no_grad():
+        for x in inputs:
+            ref = eager(*x)
+            assert torch.allclose(ref, scripted(*x), atol=1e-5)
+            assert torch.allclose(ref, compiled(*x), atol=1e-4)
+    t_compile = time.perf_counter() - t0
+
+    dgl_batches = [dgl_graphs(g) for g in batches]
+    with torch.no_grad():
+        for x, g in zip(inputs, dgl_batches):
+            assert torch.allclose(model(g), eager(*x), atol=1e-5)
+    t_dgl = median_time(model, dgl_batches, args.repeats)
+
+    print("structures:", len(graphs), "batch size:", args.batch_size)
+    print("DGL ALIGNN, eager (ms/batch): %.2f" % (1e3 * t_dgl))
+    t_eager = median_time(lambda x: eager(*x), inputs, args.repeats)
+    print("PyTorch ALIGNN, eager (ms/batch): %.2f" % (1e3 * t_eager))
+    t = median_time(lambda x: scripted(*x), inputs, args.repeats)
+    print(
+        "TorchScript (ms/batch): %.2f, speedup %.2fx, build %.1f s"
+        % (1e3 * t, t_eager / t, t_script)
+    )
+    t = median_time(lambda x: compiled(*x), inputs, args.repeats)
+    print(
+        "torch.compile (ms/batch): %.2f, speedup %.2fx, compile %.1f s"
+        % (1e3 * t, t_eager / t, t_compile)
+    )
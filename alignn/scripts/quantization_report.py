@@ -0,0 +1,163 @@
+"""Accuracy and throughput of int8 pretrained models on held-out data.
+
+For each pretrained model and its target property, predicts the
+held-out test structures with
+- the float32 model,
+- the BatchNorm-folded float32 model,
+- the dynamic int8 model,
+on CPU, and reports the MAE against the target, the deviation of
+each variant from float32 and the throughput, e.g.
+
+`python -m alignn.scripts.quantization_report
+--model_name jv_formation_energy_peratom_alignn
+--target formation_energy_peratom --id_file ids_train_val_test.json`
+
+Test ids are read from the `id_test` entry of `--id_file` (written by
+training); without it, `--n_structures` records are drawn at random.
+"""
+import argparse
+import csv
+import json
+import tempfile
+import time
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader
+
+from alignn.data import get_torch_dataset, load_dataset
+from alignn.models.fusion import fuse_for_inference, quantize_for_inference
+from alignn.pretrained import get_figshare_model
+
+parser = argparse.ArgumentParser(description="Int8 quantization report.")
+parser.add_argument(
+    "--model_name", nargs="+", required=True, help="Pretrained model names"
+)
+parser.add_argument(
+    "--target", nargs="+", required=True, help="Target of each model"
+)
+parser.add_argument("--dataset", default="dft_3d", help="JARVIS dataset")
+parser.add_argument("--id_tag", default="jid")
+parser.add_argument(
+    "--id_file", default=None, help="ids_train_val_test.json of the model"
+)
+parser.add_argument("--n_structures", type=int, default=500)
+parser.add_argument("--batch_size", type=int, default=16)
+parser.add_argument("--cutoff", type=float, default=8.0)
+parser.add_argument("--seed", type=int, default=123)
+parser.add_argument("--output", default=None, help="CSV file for the report")
+
+
+def held_out_loader(
+    records, target, id_tag="jid", cutoff=8.0, batch_size=16
+):
+    """Batch the test structures as in `get_multiple_predictions`."""
+    data = get_torch_dataset(
+        dataset=records,
+        id_tag=id_tag,
+        target=target,
+        neighbor_strategy="k-nearest",
+        atom_features="cgcnn",
+        use_canonize=True,
+        line_graph=True,
+        cutoff=cutoff,
+        output_dir=tempfile.mkdtemp(),
+    )
+    return DataLoader(
+        data,
+        batch_size=batch_size,
+        shuffle=False,
+        collate_fn=data.collate_line_graph,
+    )
+
+
+def predict(model, loader):
+    """Get predictions, targets and seconds per structure."""
+    predictions, targets = [], []
+    with torch.no_grad():
+        t0 = time.perf_counter()
+        for g, lg, target in loader:
+            predictions.append(model([g, lg]).reshape(len(target), -1))
+            targets.append(target.reshape(len(target), -1))
+        t = time.perf_counter() - t0
+    predictions = torch.cat(predictions).numpy()
+    return predictions, torch.cat(targets).numpy(), t / len(predictions)
+
+
+def quantization_report(model, loader):
+    """Compare float32, folded and int8 variants of a model on `loader`.
+
+    The first pass over `loader` is a warm-up and is not reported.
+    """
+    variants = {
+        "fp32": model.cpu().eval(),
+        "fp32_folded": fuse_for_inference(model),
+        "int8": quantize_for_inference(model),
+    }
+    predict(model, loader)
+    rows = []
+    for name, m in variants.items():
+        pred, target, t = predict(m, loader)
+        if name == "fp32":
+            reference, t_reference = pred, t
+        rows.append(
+            {
+                "variant": name,
+                "mae": float(np.abs(pred - target).mean()),
+                "mae_vs_fp32": float(np.abs(pred - reference).mean()),
+                "max_abs_vs_fp32": float(np.abs(pred - reference).max()),
+                "ms_per_structure": 1e3 * t,
+                "speedup": t_reference / t,
+            }
+        )
+    return rows
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    if len(args.model_name) != len(args.target):
+        raise ValueError("Give one --target per --model_name")
+    report = []
+    for model_name, target in zip(args.model_name, args.target):
+        df = load_dataset(
+            name=args.dataset,
+            target=target,
+            columns=[args.id_tag, "atoms"],
+        )
+        if args.id_file is not None:
+            with open(args.id_file) as f:
+                id_test = set(json.load(f)["id_test"])
+            df = df[df[args.id_tag].isin(id_test)]
+        else:
+            df = df.sample(
+                n=min(args.n_structures, len(df)), random_state=args.seed
+            )
+        loader = held_out_loader(
+            df.to_dict(orient="records"),
+            target,
+            id_tag=args.id_tag,
+            cutoff=args.cutoff,
+            batch_size=args.batch_size,
+        )
+        model = get_figshare_model(model_name)
+        print(model_name, target, "test structures:", len(df))
+        for row in quantization_report(model, loader):
+            print(
+                "  %-12s MAE %.4f vs fp32: mean %.2e max %.2e, "
+                "%.2f ms/structure (%.2fx)"
+                % (
+                    row["variant"],
+                    row["mae"],
+                    row["mae_vs_fp32"],
+                    row["max_abs_vs_fp32"],
+                    row["ms_per_structure"],
+                    row["speedup"],
+                )
+            )
+            report.append({"model_name": model_name, "target": target, **row})
+
+    if args.output is not None:
+        with open(args.output, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(report[0]))
+            writer.writeheader()
+            writer.writerows(report)
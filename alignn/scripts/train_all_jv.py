@@ -40,6 +40,8 @@ props = [
     "dfpt_piezo_max_dij",
 ]
 cwd_home = os.getcwd()
+# graphs are featurized once and shared by every property in the sweep
+cachedir = os.path.join(cwd_home, "graph_cache")
 for i in props:
     model_name = "jv_" + i + "_alignn"
     os.makedirs(model_name)
@@ -49,7 +51,7 @@ for i in props:
         "from alignn.train_props import "
         + 'train_prop_model \ntrain_prop_model(learning_rate=0.001,prop="'
     )
-    line = tmp + i + '")\n'
+    line = tmp + i + '",cachedir="' + cachedir + '")\n'
     f.write(line)
     f.close()
     f = open(model_name, "w")
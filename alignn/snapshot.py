@@ -0,0 +1,138 @@
+"""Versioned on-disk snapshots of featurized training datasets.
+
+A snapshot directory holds everything `get_train_val_loaders` needs
+to rebuild its data loaders without preprocessing:
+
+```
+manifest.json   format version and dataset/graph parameters
+data.json       ids and targets
+graphs/         `GraphStore` with crystal graphs and line graphs
+```
+
+Snapshots are only reused when their parameters match
+the current configuration; otherwise they are rebuilt.
+Train/val/test splits are not stored: they are cheap to recompute,
+so changing them reuses the featurized graphs.
+"""
+import json
+import os
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+import pandas as pd
+from jarvis.db.jsonutils import dumpjson, loadjson
+from tqdm import tqdm
+
+from alignn.graph_store import GraphStore, GraphStoreDataset
+from alignn.graph_store import SharedGraphDataset
+from alignn.graph_store import write_graph_store
+from alignn.graphs import StructureDataset
+
+# bump when the snapshot layout changes
+SNAPSHOT_FORMAT_VERSION = 2
+
+
+def _normalize(params: dict) -> dict:
+    """Round-trip parameters through JSON for comparison."""
+    return json.loads(json.dumps(params, sort_keys=True))
+
+
+def save_snapshot(
+    path: Union[str, Path],
+    graphs: Iterable,
+    ids: list,
+    targets: list,
+    params: dict,
+    line_graph: bool = True,
+):
+    """Write a dataset snapshot.
+
+    `graphs` yields crystal graphs, or (graph, line graph) pairs,
+    in the order of `ids` and `targets`.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    manifest = path / "manifest.json"
+    if manifest.is_file():
+        os.remove(manifest)
+
+    write_graph_store(path / "graphs", graphs, line_graph=line_graph)
+    dumpjson(
+        data={"ids": list(ids), "targets": list(targets)},
+        filename=str(path / "data.json"),
+    )
+    # write the manifest last: its presence marks a complete snapshot
+    dumpjson(
+        data={
+            "version": SNAPSHOT_FORMAT_VERSION,
+            "params": _normalize(params),
+        },
+        filename=str(manifest),
+    )
+
+
+def load_snapshot(path: Union[str, Path], params: dict) -> Optional[dict]:
+    """Load a dataset snapshot if it matches `params`, else None."""
+    path = Path(path)
+    manifest = path / "manifest.json"
+    if not manifest.is_file():
+        return None
+
+    manifest = loadjson(str(manifest))
+    if manifest["version"] != SNAPSHOT_FORMAT_VERSION:
+        print("Snapshot version mismatch, rebuilding:", path)
+        return None
+    stored, current = manifest["params"], _normalize(params)
+    if stored != current:
+        changed = sorted(
+            k
+            for k in set(stored) | set(current)
+            if stored.get(k) != current.get(k)
+        )
+        print("Snapshot parameters changed, rebuilding:", changed)
+        return None
+
+    snapshot = loadjson(str(path / "data.json"))
+    snapshot["store"] = GraphStore(path / "graphs")
+    return snapshot
+
+
+def snapshot_dataset(
+    snapshot: dict,
+    target: str,
+    atom_features="atomic_number",
+    line_graph=False,
+    classification=False,
+    id_tag="jid",
+    graph_storage="memory",
+):
+    """Build the torch Dataset for a loaded snapshot.
+
+    With `graph_storage="memory"`, graphs are read into memory,
+    with `"shared"` the store is copied into shared memory;
+    otherwise they are sliced from the memory-mapped store on access.
+    """
+    df = pd.DataFrame({id_tag: snapshot["ids"], target: snapshot["targets"]})
+    store = snapshot["store"]
+    kwargs = dict(
+        target=target,
+        atom_features=atom_features,
+        line_graph=line_graph,
+        classification=classification,
+        id_tag=id_tag,
+    )
+    if graph_storage == "shared":
+        return SharedGraphDataset(df, store, **kwargs)
+    if graph_storage != "memory":
+        return GraphStoreDataset(df, store, **kwargs)
+
+    graphs, line_graphs = [], None
+    if line_graph:
+        line_graphs = []
+    for i in tqdm(range(len(store))):
+        g = store.get_graph(i)
+        g.ndata["atom_features"] = g.ndata.pop("atomic_number")
+        graphs.append(g)
+        if line_graph:
+            line_graphs.append(store.get_line_graph(i))
+    return StructureDataset(df, graphs, line_graphs=line_graphs, **kwargs)
@@ -0,0 +1,47 @@
+"""Dataset index test suite."""
+import glob
+import os
+
+import numpy as np
+from jarvis.core.atoms import Atoms
+
+from alignn.dataset_index import build_dataset_index
+
+sample_dir = os.path.join(
+    os.path.dirname(__file__), "..", "examples", "sample_data"
+)
+
+
+def test_dataset_index(tmp_path):
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:4]
+    records = [
+        {
+            "jid": os.path.basename(p),
+            "atoms": Atoms.from_poscar(p).to_dict(),
+            "target": y,
+            "multi": [y, 1.0],
+        }
+        for p, y in zip(paths, [0.5, "na", 2.0, float("nan")])
+    ]
+    index = build_dataset_index(tmp_path, records)
+    assert index.kinds == {
+        "jid": "string",
+        "atoms": "atoms",
+        "target": "number",
+        "multi": "object",
+    }
+    rows, y = index.select_target("target", target_multiplication_factor=2)
+    assert rows.tolist() == [0, 2]
+    assert np.allclose(y, [1.0, 4.0])
+    rows, y = index.select_target("target", classification_threshold=1.0)
+    assert y.tolist() == [0, 1]
+
+    for r, x in zip(index.records(["jid", "atoms"], rows), rows):
+        assert list(r) == ["jid", "atoms"]
+        assert r["jid"] == records[x]["jid"]
+        a = Atoms.from_dict(r["atoms"])
+        b = Atoms.from_dict(records[x]["atoms"])
+        assert np.allclose(a.lattice_mat, b.lattice_mat)
+        assert np.allclose(a.frac_coords, b.frac_coords)
+        assert a.elements == b.elements
+    assert index.records(["multi"])[1]["multi"][1] == 1.0
@@ -0,0 +1,330 @@
+"""Graph construction test suite."""
+import glob
+import os
+import pickle
+import shutil
+
+import dgl
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from jarvis.core.atoms import Atoms
+from jarvis.core.graphs import Graph
+
+from alignn.data import get_train_val_loaders, ingest_id_prop, load_graphs
+from alignn.graph_cache import GraphCache, structure_hash
+from alignn.graph_store import GraphStoreDataset, SharedGraphDataset
+from alignn.graph_store import write_graph_store
+from alignn.samplers import BucketBatchSampler, BudgetBatchSampler
+from alignn.graphs import (
+    LazyStructureDataset,
+    StructureDataset,
+    atom_dgl_multigraph,
+    build_line_graph,
+)
+
+sample_dir = os.path.join(
+    os.path.dirname(__file__), "..", "examples", "sample_data"
+)
+
+
+def sorted_edges(g):
+    """Sort (u, v, r) edge rows so edge sets can be compared."""
+    u, v = g.edges()
+    r = np.round(g.edata["r"].numpy(), 4)
+    edges = np.column_stack([u.numpy(), v.numpy(), r])
+    return edges[np.lexsort(edges.T[::-1])]
+
+
+def test_neighbor_edges_match_jarvis():
+    for path in sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:10]:
+        atoms = Atoms.from_poscar(path)
+        for use_canonize in (True, False):
+            reference = Graph.atom_dgl_multigraph(
+                atoms, compute_line_graph=False, use_canonize=use_canonize
+            )
+            g = atom_dgl_multigraph(
+                atoms, compute_line_graph=False, use_canonize=use_canonize
+            )
+            assert g.num_nodes() == reference.num_nodes()
+            assert np.allclose(
+                sorted_edges(g), sorted_edges(reference), atol=1e-3
+            )
+
+
+def test_graph_cache(tmp_path):
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:5]
+    atoms = [Atoms.from_poscar(p).to_dict() for p in paths]
+    df = pd.DataFrame({"atoms": atoms})
+    graphs = load_graphs(df, use_canonize=True, cachedir=tmp_path)
+    cache = GraphCache(tmp_path, use_canonize=True)
+    keys = [structure_hash(a) for a in df["atoms"]]
+    assert all(k in cache for k in keys)
+    assert GraphCache(tmp_path, use_canonize=False).root != cache.root
+
+    cached = load_graphs(df, use_canonize=True, cachedir=tmp_path)
+    for g, h in zip(graphs, cached):
+        assert torch.equal(g.edata["r"], h.edata["r"])
+
+    cached, line_graphs = load_graphs(
+        df, use_canonize=True, cachedir=tmp_path, line_graph=True
+    )
+    for g, lg in zip(cached, line_graphs):
+        assert torch.equal(lg.edata["h"], build_line_graph(g).edata["h"])
+
+    with pytest.warns(DeprecationWarning):
+        load_graphs(df, name="dft_3d", use_canonize=True, cachedir=tmp_path)
+
+
+def test_graph_workers():
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:12]
+    atoms = [Atoms.from_poscar(p).to_dict() for p in paths]
+    df = pd.DataFrame({"atoms": atoms})
+    graphs = load_graphs(df, use_canonize=True)
+    # six chunks of two structures, more than the four kept in flight
+    pooled = load_graphs(df, use_canonize=True, graph_workers=2)
+    assert len(pooled) == len(graphs)
+    for g, h in zip(graphs, pooled):
+        assert torch.equal(g.edata["r"], h.edata["r"])
+
+
+def test_graph_store(tmp_path):
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:5]
+    atoms = [Atoms.from_poscar(p).to_dict() for p in paths]
+    df = pd.DataFrame({"atoms": atoms, "jid": paths, "target": 1.0})
+    graphs, line_graphs = load_graphs(df, use_canonize=True, line_graph=True)
+    store = write_graph_store(tmp_path, zip(graphs, line_graphs))
+    store = pickle.loads(pickle.dumps(store))
+    assert len(store) == len(graphs)
+    for i, (g, lg) in enumerate(zip(graphs, line_graphs)):
+        h, hlg = store.get_graph(i), store.get_line_graph(i)
+        assert all(torch.equal(x, y) for x, y in zip(g.edges(), h.edges()))
+        assert torch.equal(g.edata["r"], h.edata["r"])
+        assert torch.equal(
+            g.ndata["atom_features"], h.ndata["atomic_number"]
+        )
+        assert all(torch.equal(x, y) for x, y in zip(lg.edges(), hlg.edges()))
+        assert torch.equal(lg.edata["h"], hlg.edata["h"])
+
+    data = GraphStoreDataset(df, store, target="target", line_graph=True)
+    g, lg, labels = data.collate_line_graph([data[i] for i in range(3)])
+    ref = dgl.batch(graphs[:3])
+    assert torch.equal(g.batch_num_nodes(), ref.batch_num_nodes())
+    assert all(torch.equal(x, y) for x, y in zip(g.edges(), ref.edges()))
+    assert torch.equal(g.ndata["atom_features"], ref.ndata["atom_features"])
+    ref = dgl.batch(line_graphs[:3])
+    assert torch.equal(lg.batch_num_edges(), ref.batch_num_edges())
+    assert all(torch.equal(x, y) for x, y in zip(lg.edges(), ref.edges()))
+
+    shared = SharedGraphDataset(df, store, target="target", line_graph=True)
+    idx = [4, 1, 2]
+    g, lg, labels = shared.collate_line_graph(idx)
+    ref_g, ref_lg, _ = data.collate_line_graph([data[i] for i in idx])
+    assert torch.equal(g.batch_num_edges(), ref_g.batch_num_edges())
+    assert all(torch.equal(x, y) for x, y in zip(g.edges(), ref_g.edges()))
+    assert torch.equal(g.edata["r"], ref_g.edata["r"])
+    assert torch.equal(g.ndata["atom_features"], ref_g.ndata["atom_features"])
+    assert all(torch.equal(x, y) for x, y in zip(lg.edges(), ref_lg.edges()))
+    assert torch.equal(lg.edata["h"], ref_lg.edata["h"])
+
+    # same feature standardization as an in-memory dataset
+    reference = StructureDataset(df, load_graphs(df), target="target")
+    reference.setup_standardizer([0, 2, 3])
+    for d in (data, shared):
+        d.setup_standardizer([0, 2, 3])
+        assert torch.allclose(
+            d.atom_feature_mean, reference.atom_feature_mean.float()
+        )
+        assert torch.allclose(
+            d.atom_feature_std, reference.atom_feature_std.float()
+        )
+    with pytest.raises(NotImplementedError):
+        data.graphs
+
+
+def test_lazy_dataset(tmp_path):
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:3]
+    atoms = [Atoms.from_poscar(p).to_dict() for p in paths]
+    df = pd.DataFrame({"atoms": atoms, "jid": paths, "target": 1.0})
+    cache = GraphCache(tmp_path, use_canonize=True)
+    data = LazyStructureDataset(
+        df, "target", line_graph=True, use_canonize=True, cache=cache
+    )
+    graphs, line_graphs = load_graphs(df, use_canonize=True, line_graph=True)
+    sizes = np.array(
+        [
+            [g.num_nodes(), g.num_edges(), lg.num_edges()]
+            for g, lg in zip(graphs, line_graphs)
+        ]
+    )
+    # uncached structures are sized by upper bounds
+    assert (data.graph_sizes() >= sizes).all()
+    for i, (g, lg) in enumerate(zip(graphs, line_graphs)):
+        h, hlg, label = data[i]
+        assert torch.equal(g.edata["r"], h.edata["r"])
+        assert torch.equal(lg.edata["h"], hlg.edata["h"])
+        assert structure_hash(atoms[i]) in cache
+    assert np.array_equal(data.graph_sizes(), sizes)
+
+
+def test_lazy_loader_keeps_worker_cache(tmp_path, monkeypatch):
+    built = tmp_path / "built.txt"
+    build = LazyStructureDataset._build
+
+    def logged_build(self, idx):
+        with open(built, "a") as f:
+            f.write("%d\n" % idx)
+        return build(self, idx)
+
+    # patched before the workers fork, so they log their cache misses
+    monkeypatch.setattr(LazyStructureDataset, "_build", logged_build)
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:10]
+    dataset = [
+        {"atoms": Atoms.from_poscar(p).to_dict(), "jid": p, "target": 1.0}
+        for p in paths
+    ]
+    train_loader, _, _, _ = get_train_val_loaders(
+        dataset_array=dataset,
+        target="target",
+        batch_size=2,
+        workers=1,
+        pin_memory=False,
+        use_canonize=True,
+        filename=str(tmp_path / "sample"),
+        output_dir=str(tmp_path),
+        graph_storage="lazy",
+    )
+    for epoch in range(2):
+        for g, lg, labels in train_loader:
+            pass
+    # 8 training structures in 4 full batches; the second epoch
+    # is served from the worker LRU
+    assert len(train_loader.dataset) == 8
+    assert len(built.read_text().split()) == 8
+
+
+def test_dataset_snapshot(tmp_path, capsys):
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:10]
+    dataset = [
+        {"atoms": Atoms.from_poscar(p).to_dict(), "jid": p, "target": i}
+        for i, p in enumerate(paths)
+    ]
+    kwargs = dict(
+        dataset_array=dataset,
+        target="target",
+        batch_size=2,
+        pin_memory=False,
+        use_canonize=True,
+        save_dataloader=True,
+        filename=str(tmp_path / "sample"),
+    )
+
+    def loaders(output_dir, **extra):
+        out = get_train_val_loaders(
+            output_dir=str(tmp_path / output_dir), **kwargs, **extra
+        )
+        return out, capsys.readouterr().out
+
+    (train_loader, _, _, _), log = loaders("first")
+    assert "Writing dataset snapshot" in log
+    # a new split reuses the snapshot and still writes every output file
+    (train_loader, _, _, _), log = loaders(
+        "second", split_seed=7, standard_scalar_and_pca=True
+    )
+    assert "Loading dataset snapshot" in log
+    files = ["ids_train_val_test.json", "mad", "sc.pkl", "dataset_data_range"]
+    files += [k + "_data_range" for k in ("train_data", "val_data")]
+    for f in files:
+        assert (tmp_path / "second" / f).is_file(), f
+    train = train_loader.dataset
+    assert list(train.ids) == [dataset[i]["jid"] for i in train.indices]
+    labels = [dataset[i]["target"] for i in train.indices]
+    assert train.labels.tolist() == labels
+    # changed targets under the same ids are not served from the snapshot
+    dataset[0]["target"] = 100.0
+    _, log = loaders("third")
+    assert "Snapshot parameters changed" in log
+
+
+def test_ingest_id_prop(tmp_path, capsys):
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:8]
+    for p in paths:
+        shutil.copy(p, tmp_path)
+    names = [os.path.basename(p) for p in paths]
+    for n_outputs in (1, 2):
+        targets = np.arange(len(paths) * n_outputs, dtype=float)
+        targets = targets.reshape(len(paths), n_outputs)
+        # a NaN scalar target drops the row, a NaN output does not
+        targets[2, -1] = np.nan
+        with open(tmp_path / "id_prop.csv", "w") as f:
+            for name, y in zip(names, targets):
+                f.write(",".join([name] + [str(j) for j in y]) + "\n")
+        store_path = str(tmp_path / "dataset_graphs")
+        store, records = ingest_id_prop(
+            str(tmp_path), store_path, chunk_size=3, use_canonize=True
+        )
+        log = capsys.readouterr().out
+        assert len(store) == len(records) == len(paths) - (n_outputs == 1)
+        assert ("Dropped rows with NaN targets: 1" in log) == (n_outputs == 1)
+        # the store of the previous targets is rewritten
+        assert ("parameters changed" in log) == (n_outputs == 2)
+
+        dataset = []
+        for name, y in zip(names, targets.tolist()):
+            atoms = Atoms.from_poscar(str(tmp_path / name)).to_dict()
+            y = y[0] if n_outputs == 1 else y
+            dataset.append({"atoms": atoms, "jid": name, "target": y})
+        loaders = []
+        for kwargs in (
+            dict(dataset_array=dataset),
+            dict(dataset_array=records, graph_store=store),
+        ):
+            loaders.append(
+                get_train_val_loaders(
+                    target="target",
+                    batch_size=2,
+                    val_ratio=0.2,
+                    test_ratio=0.2,
+                    pin_memory=False,
+                    use_canonize=True,
+                    output_dir=str(tmp_path / "out"),
+                    **kwargs,
+                )[:3]
+            )
+        for reference, loader in zip(*loaders):
+            a, b = reference.dataset, loader.dataset
+            assert list(a.ids) == list(b.ids)
+            np.testing.assert_array_equal(a.labels, b.labels)
+            for i in range(len(a)):
+                assert a[i][0].num_edges() == b[i][0].num_edges()
+
+        # a complete store of the same records is reused
+        store, _ = ingest_id_prop(
+            str(tmp_path), store_path, chunk_size=3, use_canonize=True
+        )
+        assert "Reusing graph store" in capsys.readouterr().out
+
+
+def test_budget_batch_sampler():
+    sizes = np.array([[n, 10 * n, 100 * n] for n in [1, 2, 3, 4, 5, 20]])
+    sampler = BudgetBatchSampler(sizes, max_edges=60, seed=0)
+    n_batches = len(sampler)
+    batches = list(sampler)
+    assert len(batches) == n_batches
+    assert sorted(i for b in batches for i in b) == list(range(len(sizes)))
+    for b in batches:
+        assert len(b) == 1 or sizes[b, 1].sum() <= 60
+    # next epoch is reshuffled but still covers every structure once
+    assert sampler.epoch == 1
+    assert sorted(i for b in sampler for i in b) == list(range(len(sizes)))
+
+
+def test_bucket_batch_sampler():
+    n = np.arange(1, 21)
+    sizes = np.stack([n, 10 * n, 100 * n], axis=1)[::-1]
+    sampler = BucketBatchSampler(sizes, batch_size=4, drop_last=True)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 5
+    for b in batches:
+        assert np.ptp(sizes[b, 0]) == 3
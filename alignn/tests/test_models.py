@@ -0,0 +1,405 @@
+"""Model layer test suite."""
+import glob
+import os
+
+import dgl
+import pandas as pd
+import pytest
+import torch
+from jarvis.core.atoms import Atoms
+
+from alignn.data import load_graphs
+from alignn.graphs import StructureDataset, atom_dgl_multigraph
+from alignn.models import alignn_layernorm, alignn_torch, dense_alignn
+from alignn.models.alignn_cgcnn import ACGCNN, ACGCNNConfig
+from alignn.models.alignn import (
+    ALIGNN,
+    ALIGNNConfig,
+    EdgeGatedGraphConv,
+    FusedEdgeGatedGraphConv,
+)
+from alignn.models.dense_alignn import (
+    DenseALIGNN,
+    DenseALIGNNConfig,
+    DenseFeatureBuffer,
+)
+from alignn.models.fusion import fuse_for_inference, quantize_for_inference
+from alignn.models.modified_cgcnn import CGCNN, CGCNNConfig
+from alignn.pretrained import get_multiple_properties
+from alignn.train import autocast_model_fn, float32_norms
+
+sample_dir = os.path.join(
+    os.path.dirname(__file__), "..", "examples", "sample_data"
+)
+
+
+def sample_batch(n=4):
+    """Batch of crystal graphs and line graphs from the sample data."""
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:n]
+    atoms = [Atoms.from_poscar(p).to_dict() for p in paths]
+    df = pd.DataFrame({"atoms": atoms, "jid": paths, "target": 1.0})
+    graphs, line_graphs = load_graphs(df, use_canonize=True, line_graph=True)
+    data = StructureDataset(
+        df,
+        graphs,
+        target="target",
+        atom_features="cgcnn",
+        line_graph=True,
+        line_graphs=line_graphs,
+    )
+    return data.collate_line_graph([data[i] for i in range(n)])
+
+
+def test_fused_edge_gated_conv():
+    torch.manual_seed(0)
+    g = dgl.rand_graph(20, 120)
+    reference = EdgeGatedGraphConv(16, 16)
+    fused = FusedEdgeGatedGraphConv(16, 16)
+    fused.load_state_dict(reference.state_dict())
+    x = torch.randn(20, 16, requires_grad=True)
+    y = torch.randn(120, 16, requires_grad=True)
+    grads = []
+    for layer in (reference, fused):
+        out = layer(g, x, y)
+        grads.append(
+            torch.autograd.grad(out[0].sum() + out[1].pow(2).sum(), [x, y])
+        )
+        grads[-1] += out
+    for a, b in zip(*grads):
+        assert torch.allclose(a, b, atol=1e-5)
+
+
+def test_fused_alignn_checkpoint():
+    torch.manual_seed(0)
+    g, lg, _ = sample_batch()
+    model = ALIGNN(ALIGNNConfig(name="alignn", alignn_layers=2, gcn_layers=2))
+    fused = ALIGNN(
+        ALIGNNConfig(
+            name="alignn", alignn_layers=2, gcn_layers=2, fused_conv=True
+        )
+    )
+    fused.load_state_dict(model.state_dict())
+    model.eval()
+    fused.eval()
+    with torch.no_grad():
+        assert torch.allclose(model([g, lg]), fused([g, lg]), atol=1e-5)
+
+
+def test_torch_backend():
+    torch.manual_seed(0)
+    g, lg, _ = sample_batch()
+    model = ALIGNN(ALIGNNConfig(name="alignn", alignn_layers=2, gcn_layers=2))
+    config = alignn_torch.ALIGNNTorchConfig(
+        name="alignn_torch", alignn_layers=2, gcn_layers=2
+    )
+    torch_model = alignn_torch.ALIGNN(config)
+    torch_model.load_state_dict(model.state_dict())
+    model.eval()
+    torch_model.eval()
+    scripted = torch.jit.script(torch_model)
+    with torch.no_grad():
+        ref = model([g, lg])
+        assert torch.allclose(ref, torch_model(alignn_torch.from_dgl(g, lg)))
+
+        # graphs built without DGL
+        paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:4]
+        graphs = [
+            alignn_torch.atoms_to_graph(
+                Atoms.from_poscar(p), use_canonize=True
+            )
+            for p in paths
+        ]
+        batch = alignn_torch.batch_graphs(graphs)
+        assert torch.allclose(ref, scripted(batch), atol=1e-5)
+
+        # inference module on plain tensors
+        inference = alignn_torch.inference_model(
+            model.state_dict(), config, mode="script"
+        )
+        out = inference(*alignn_torch.inference_inputs(batch))
+        assert torch.allclose(ref, out, atol=1e-5)
+
+
+def test_torch_conv_widening():
+    torch.manual_seed(0)
+    g = dgl.rand_graph(20, 120)
+    src, dst = g.edges()
+    x = torch.randn(20, 8)
+    y = torch.randn(120, 8)
+    reference = EdgeGatedGraphConv(8, 16, residual=False)
+    conv = alignn_torch.EdgeGatedGraphConv(8, 16, residual=False)
+    conv.load_state_dict(reference.state_dict())
+    for a, b in zip(reference(g, x, y), conv(src, dst, x, y)):
+        assert torch.allclose(a, b, atol=1e-5)
+
+
+def test_fuse_for_inference():
+    torch.manual_seed(0)
+    g, lg, _ = sample_batch()
+    models = [
+        ALIGNN(ALIGNNConfig(name="alignn", alignn_layers=2, gcn_layers=2)),
+        ALIGNN(
+            ALIGNNConfig(
+                name="alignn", alignn_layers=1, gcn_layers=1, fused_conv=True
+            )
+        ),
+        DenseALIGNN(DenseALIGNNConfig(name="dense_alignn", norm="batchnorm")),
+        ACGCNN(ACGCNNConfig(name="alignn_cgcnn", conv_layers=2)),
+        CGCNN(CGCNNConfig(name="cgcnn", conv_layers=2)),
+    ]
+    for model in models:
+        # non-trivial running statistics
+        for m in model.modules():
+            if isinstance(m, torch.nn.BatchNorm1d):
+                m.running_mean.uniform_(-1, 1)
+                m.running_var.uniform_(0.5, 2)
+                m.weight.data.uniform_(0.5, 2)
+                m.bias.data.uniform_(-1, 1)
+        model.eval()
+        fused = fuse_for_inference(model)
+        n_norms = [
+            sum(isinstance(m, torch.nn.BatchNorm1d) for m in x.modules())
+            for x in (model, fused)
+        ]
+        assert n_norms[1] < n_norms[0]
+        with torch.no_grad():
+            # some models pop input features from the graphs
+            out = [m([g.local_var(), lg.local_var()]) for m in (model, fused)]
+            assert torch.allclose(*out, rtol=1e-4, atol=1e-4)
+
+
+def test_quantize_for_inference():
+    torch.manual_seed(0)
+    g, lg, _ = sample_batch()
+    for fused_conv in (False, True):
+        model = ALIGNN(
+            ALIGNNConfig(
+                name="alignn",
+                alignn_layers=1,
+                gcn_layers=1,
+                fused_conv=fused_conv,
+            )
+        )
+        model.eval()
+        quantized = quantize_for_inference(model)
+        assert any(
+            isinstance(m, torch.ao.nn.quantized.dynamic.Linear)
+            for m in quantized.modules()
+        )
+        with torch.no_grad():
+            out = [m([g, lg]) for m in (model, quantized)]
+        assert torch.allclose(*out, atol=0.05)
+
+
+def test_bf16_autocast():
+    torch.manual_seed(0)
+    g, lg, _ = sample_batch()
+    model = ALIGNN(ALIGNNConfig(name="alignn", alignn_layers=1, gcn_layers=1))
+    model.eval()
+    with torch.no_grad():
+        ref = model([g, lg])
+        float32_norms(model)
+        out = autocast_model_fn(torch.bfloat16)(model, [g, lg])
+    assert out.dtype == torch.float32
+    assert torch.allclose(ref, out, rtol=0.05, atol=0.05)
+
+
+def test_bf16_gate_denominator(monkeypatch):
+    torch.manual_seed(0)
+    g = dgl.rand_graph(20, 120)
+    x = torch.randn(20, 16)
+    y = torch.randn(120, 16)
+    dtypes = []
+    copy_e_sum = dgl.ops.copy_e_sum
+    index_add = torch.Tensor.index_add
+
+    def spy_copy_e_sum(*args):
+        out = copy_e_sum(*args)
+        dtypes.append(out.dtype)
+        return out
+
+    def spy_index_add(self, *args):
+        out = index_add(self, *args)
+        dtypes.append(out.dtype)
+        return out
+
+    # update_all(copy_e, sum) also dispatches to copy_e_sum
+    monkeypatch.setattr(dgl.ops, "copy_e_sum", spy_copy_e_sum)
+    monkeypatch.setattr(torch.Tensor, "index_add", spy_index_add)
+    with torch.autocast("cpu", dtype=torch.bfloat16):
+        EdgeGatedGraphConv(16, 16)(g, x, y)
+        FusedEdgeGatedGraphConv(16, 16)(g, x, y)
+        alignn_layernorm.EdgeGatedGraphConv(16, 16)(g, x, y)
+        dense_alignn.EdgeGatedGraphConv(16, 16, 16)(g, x, y)
+        src, dst = g.edges()
+        alignn_torch.EdgeGatedGraphConv(16, 16)(src, dst, x, y)
+    # gate denominators sum in float32, the numerator of the
+    # PyTorch backend stays in bfloat16
+    assert dtypes == [torch.float32] * 4 + [torch.bfloat16, torch.float32]
+
+    # float64 models are not downcast, nor is the caller's graph modified
+    dtypes.clear()
+    x, y = x.double(), y.double()
+    for layer in (
+        EdgeGatedGraphConv(16, 16),
+        FusedEdgeGatedGraphConv(16, 16),
+        alignn_layernorm.EdgeGatedGraphConv(16, 16),
+        dense_alignn.EdgeGatedGraphConv(16, 16, 16),
+    ):
+        out = layer.double()(g, x, y)
+        assert all(t.dtype == torch.float64 for t in out)
+    alignn_torch.EdgeGatedGraphConv(16, 16).double()(src, dst, x, y)
+    assert dtypes == [torch.float64] * 6
+    assert not g.ndata and not g.edata
+
+
+def test_checkpoint_layers():
+    torch.manual_seed(0)
+    g, lg, y = sample_batch()
+    configs = [
+        ALIGNNConfig(name="alignn", alignn_layers=2, gcn_layers=2),
+        DenseALIGNNConfig(
+            name="dense_alignn",
+            alignn_layers=2,
+            gcn_layers=2,
+            norm="batchnorm",
+        ),
+    ]
+    for config in configs:
+        model_class = ALIGNN if config.name == "alignn" else DenseALIGNN
+        reference = model_class(config)
+        model = model_class(config.copy(update={"checkpoint_layers": True}))
+        model.load_state_dict(reference.state_dict())
+        grads = []
+        for m in (reference, model):
+            out = m([g.local_var(), lg.local_var()])
+            torch.nn.functional.mse_loss(out, y).backward()
+            grads.append([p.grad for p in m.parameters()])
+        for a, b in zip(*grads):
+            # parameters of unused last-layer outputs get no gradient
+            assert (a is None and b is None) or torch.allclose(
+                a, b, atol=1e-5
+            )
+        # running statistics are updated once, not again on recomputation
+        for a, b in zip(reference.buffers(), model.buffers()):
+            assert torch.allclose(a.float(), b.float())
+
+
+def test_checkpoint_layers_torch_version(monkeypatch):
+    model = ALIGNN(
+        ALIGNNConfig(name="alignn", alignn_layers=1, checkpoint_layers=True)
+    )
+    g, lg, _ = sample_batch()
+    monkeypatch.setattr(torch, "__version__", "2.0.1")
+    with pytest.raises(RuntimeError, match="torch>=2.1"):
+        model([g, lg])
+    # inference does not checkpoint, so it runs on any version
+    with torch.no_grad():
+        model([g, lg])
+
+
+def test_dense_feature_buffer():
+    torch.manual_seed(0)
+    u = torch.randn(24, 8, requires_grad=True)
+    w = torch.randn(24, 3)
+    features = [torch.randn(10, 8, requires_grad=True)]
+    buffer = DenseFeatureBuffer(features[0], 24)
+    views = []
+    for _ in range(2):
+        # later writes must not invalidate views saved for backward
+        views.append(buffer.view())
+        features.append(torch.tanh(views[-1] @ u[: views[-1].shape[1]]))
+        buffer.append(features[-1])
+    out = buffer.view()
+    assert torch.equal(out, torch.cat(features, 1))
+    (out @ w).sum().backward()
+    grad = features[0].grad.clone()
+
+    features[0].grad = None
+    x = [features[0]]
+    for _ in range(2):
+        h = torch.cat(x, 1)
+        x.append(torch.tanh(h @ u[: h.shape[1]]))
+    (torch.cat(x, 1) @ w).sum().backward()
+    assert torch.allclose(grad, features[0].grad)
+
+
+class ConcatFeatures(object):
+    """Dense features grown with torch.cat, as before the buffer."""
+
+    def __init__(self, x, width):
+        """Start from the first feature map."""
+        self.features = x
+
+    def append(self, x):
+        """Concatenate the next feature map."""
+        self.features = torch.cat([self.features, x], 1)
+
+    def view(self):
+        """Return all features so far."""
+        return self.features
+
+
+def test_dense_buffer_matches_concatenation(monkeypatch):
+    torch.manual_seed(0)
+    g, lg, _ = sample_batch()
+    for norm in ("batchnorm", "layernorm"):
+        config = DenseALIGNNConfig(
+            name="dense_alignn", alignn_layers=2, gcn_layers=2, norm=norm
+        )
+        results = []
+        for concat in (False, True):
+            if concat:
+                monkeypatch.setattr(
+                    dense_alignn, "DenseFeatureBuffer", ConcatFeatures
+                )
+            model = DenseALIGNN(config)
+            if results:
+                model.load_state_dict(results[0][0].state_dict())
+            out = model([g, lg])
+            out.pow(2).sum().backward()
+            results.append((model, out))
+        monkeypatch.undo()
+        (model, out), (reference, ref) = results
+        assert torch.allclose(out, ref, atol=1e-5)
+        for (name, p), q in zip(
+            model.named_parameters(), reference.parameters()
+        ):
+            if p.grad is None:
+                # parameters unused by this configuration
+                assert q.grad is None, name
+                continue
+            assert torch.allclose(p.grad, q.grad, atol=1e-5), name
+
+
+def test_multiple_properties():
+    torch.manual_seed(0)
+    paths = sorted(glob.glob(os.path.join(sample_dir, "*.vasp")))[:5]
+    structures = [Atoms.from_poscar(p) for p in paths]
+    models = {
+        "a": ALIGNN(ALIGNNConfig(name="alignn", alignn_layers=1)),
+        "b": ALIGNN(
+            ALIGNNConfig(name="alignn", alignn_layers=1, output_features=2)
+        ),
+    }
+    for m in models.values():
+        m.eval()
+    df = get_multiple_properties(
+        structures, models=models, ids=paths, batch_size=2
+    )
+    assert list(df.columns) == ["a", "b_0", "b_1"]
+    g, lg = atom_dgl_multigraph(structures[3], use_canonize=True)
+    with torch.no_grad():
+        expected = torch.cat([m([g, lg]).reshape(-1) for m in models.values()])
+    assert torch.allclose(
+        torch.tensor(df.loc[paths[3]].values, dtype=torch.float32),
+        expected,
+        atol=1e-5,
+    )
+
+    empty = get_multiple_properties([], models=models)
+    assert list(empty.columns) == ["a", "b_0", "b_1"] and len(empty) == 0
+    empty = get_multiple_properties(
+        model_names=["jv_formation_energy_peratom_alignn"]
+    )
+    assert list(empty.columns) == ["jv_formation_energy_peratom_alignn"]
@@ -0,0 +1,50 @@
+"""Batch prefetching test suite."""
+import itertools
+import threading
+
+import pytest
+
+from alignn.prefetch import PrefetchLoader
+
+
+def prepare(batch, non_blocking=False):
+    """Stand-in for moving a batch to the device."""
+    return 2 * batch
+
+
+def test_prefetch_order():
+    loader = PrefetchLoader(list(range(10)), prepare, n_prefetch=3)
+    assert len(loader) == 10
+    for _ in range(2):
+        assert list(loader) == [2 * i for i in range(10)]
+
+
+def test_prefetch_exception():
+    def batches():
+        yield from range(3)
+        raise ValueError("bad batch")
+
+    it = iter(PrefetchLoader(batches(), prepare))
+    assert [next(it) for _ in range(3)] == [0, 2, 4]
+    with pytest.raises(ValueError, match="bad batch"):
+        next(it)
+
+
+def test_prefetch_early_stop():
+    produced = itertools.count()
+
+    def batches():
+        # endless loader, counting the batches pulled from it
+        for i in itertools.count():
+            next(produced)
+            yield i
+
+    threads = threading.active_count()
+    it = iter(PrefetchLoader(batches(), prepare, n_prefetch=2))
+    assert [next(it) for _ in range(3)] == [0, 2, 4]
+    assert threading.active_count() == threads + 1
+    it.close()
+    # the producer thread is joined, after at most a full queue and
+    # one pending batch beyond the consumed ones
+    assert threading.active_count() == threads
+    assert next(produced) <= 3 + 2 + 1
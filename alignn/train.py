@@ -44,6 +44,7 @@ from ignite.metrics import Loss, MeanAbsoluteError
 from torch import nn
 from alignn import models
 from alignn.data import get_train_val_loaders
+from alignn.prefetch import PrefetchLoader, prepared_batch
 from alignn.config import TrainingConfig
 from alignn.models.alignn import ALIGNN
 from alignn.models.alignn_layernorm import ALIGNN as ALIGNN_LN
@@ -135,6 +136,33 @@ def setup_optimizer(params, config: TrainingConfig):
     return optimizer
 
 
+def autocast_model_fn(dtype: torch.dtype, device_type: str = "cpu"):
+    """Get an Ignite `model_fn` running the forward pass under autocast.
+
+    Outputs are cast back to float32 for the loss and metrics.
+    """
+
+    def model_fn(model, x):
+        with torch.autocast(device_type, dtype=dtype):
+            out = model(x)
+        if isinstance(out, tuple):
+            return tuple(o.float() for o in out)
+        return out.float()
+
+    return model_fn
+
+
+def float32_norms(model: nn.Module):
+    """Run the normalization layers of `model` on float32 inputs."""
+
+    def to_float(module, inputs):
+        return tuple(x.float() for x in inputs)
+
+    for m in model.modules():
+        if isinstance(m, (nn.modules.batchnorm._BatchNorm, nn.LayerNorm)):
+            m.register_forward_pre_hook(to_float)
+
+
 def train_dgl(
     config: Union[TrainingConfig, Dict[str, Any]],
     model: nn.Module = None,
@@ -227,6 +255,15 @@ def train_dgl(
             standard_scalar_and_pca=config.standard_scalar_and_pca,
             keep_data_order=config.keep_data_order,
             output_dir=config.output_dir,
+            graph_workers=config.graph_workers,
+            cachedir=config.cachedir,
+            graph_storage=config.graph_storage,
+            graph_lru_size=config.graph_lru_size,
+            max_batch_nodes=config.max_batch_nodes,
+            max_batch_edges=config.max_batch_edges,
+            max_batch_triplets=config.max_batch_triplets,
+            bucket_batching=config.bucket_batching,
+            dataset_index_dir=config.dataset_index_dir,
         )
     else:
         train_loader = train_val_test_loaders[0]
@@ -285,6 +322,9 @@ def train_dgl(
         )
 
     elif config.scheduler == "onecycle":
+        # batch count of the train loader, also with size-budget batching:
+        # ignite fixes the epoch length to it and runs
+        # epochs * steps_per_epoch steps, matching the schedule
         steps_per_epoch = len(train_loader)
         # pct_start = config.warmup_steps / (config.epochs * steps_per_epoch)
         scheduler = torch.optim.lr_scheduler.OneCycleLR(
@@ -353,30 +393,54 @@ def train_dgl(
                 output_transform=thresholded_output_transform, num_classes=2
             ),
         }
+    # optionally prepare batches (device transfer) in a background thread
+    train_data, val_data = train_loader, val_loader
+    engine_prepare_batch = prepare_batch
+    if config.prefetch_batches > 0:
+        train_data = PrefetchLoader(
+            train_loader, prepare_batch, config.prefetch_batches
+        )
+        val_data = PrefetchLoader(
+            val_loader, prepare_batch, config.prefetch_batches
+        )
+        engine_prepare_batch = prepared_batch
+
+    # bf16: forward passes under autocast, with norms,
+    # RBF expansions and gate denominators kept in float32
+    engine_kwargs = {}
+    if config.precision == "bf16":
+        float32_norms(net)
+        engine_kwargs["model_fn"] = autocast_model_fn(
+            torch.bfloat16, torch.device(device).type
+        )
+
     trainer = create_supervised_trainer(
         net,
         optimizer,
         criterion,
-        prepare_batch=prepare_batch,
+        prepare_batch=engine_prepare_batch,
         device=device,
         deterministic=deterministic,
         # output_transform=make_standard_scalar_and_pca,
+        **engine_kwargs,
     )
 
     evaluator = create_supervised_evaluator(
         net,
         metrics=metrics,
-        prepare_batch=prepare_batch,
+        prepare_batch=engine_prepare_batch,
         device=device,
         # output_transform=make_standard_scalar_and_pca,
+        **engine_kwargs,
     )
 
     train_evaluator = create_supervised_evaluator(
         net,
         metrics=metrics,
-        prepare_batch=prepare_batch,
+        prepare_batch=engine_prepare_batch,
         device=device,
         # output_transform=make_standard_scalar_and_pca,
+        **engine_kwargs,
     )
 
     # ignite event handlers:
@@ -424,8 +488,8 @@ def train_dgl(
     @trainer.on(Events.EPOCH_COMPLETED)
     def log_results(engine):
         """Print training and validation metrics to console."""
-        train_evaluator.run(train_loader)
-        evaluator.run(val_loader)
+        train_evaluator.run(train_data)
+        evaluator.run(val_data)
 
         tmetrics = train_evaluator.state.metrics
         vmetrics = evaluator.state.metrics
@@ -501,7 +565,7 @@ def train_dgl(
             )
 
     # train the model!
-    trainer.run(train_loader, max_epochs=config.epochs)
+    trainer.run(train_data, max_epochs=config.epochs)
 
     if config.log_tensorboard:
         test_loss = evaluator.state.metrics["loss"]
@@ -5,8 +5,8 @@ import csv
 import os
 import sys
 import time
-from jarvis.core.atoms import Atoms
-from alignn.data import get_train_val_loaders
+from alignn.data import get_train_val_loaders, ingest_id_prop
+from alignn.data import read_structures
 from alignn.train import train_dgl
 from alignn.config import TrainingConfig
 from jarvis.db.jsonutils import loadjson
@@ -87,46 +87,59 @@ def train_for_folder(
         config.batch_size = int(batch_size)
     if epochs is not None:
         config.epochs = int(epochs)
-    with open(id_prop_dat, "r") as f:
-        reader = csv.reader(f)
-        data = [row for row in reader]
-
-    dataset = []
-    n_outputs = []
-    multioutput = False
-    lists_length_equal = True
-    for i in data:
-        info = {}
-        file_name = i[0]
-        file_path = os.path.join(root_dir, file_name)
-        if file_format == "poscar":
-            atoms = Atoms.from_poscar(file_path)
-        elif file_format == "cif":
-            atoms = Atoms.from_cif(file_path)
-        elif file_format == "xyz":
-            # Note using 500 angstrom as box size
-            atoms = Atoms.from_xyz(file_path, box_size=500)
-        elif file_format == "pdb":
-            # Note using 500 angstrom as box size
-            # Recommended install pytraj
-            # conda install -c ambermd pytraj
-            atoms = Atoms.from_pdb(file_path, max_lat=500)
-        else:
-            raise NotImplementedError(
-                "File format not implemented", file_format
+    graph_store = None
+    if config.ingest_chunk_size is not None:
+        # stream structures into an on-disk graph store chunk by chunk
+        if config.graph_storage == "memory":
+            print("Streaming ingestion: training from mmap graph storage")
+            config.graph_storage = "mmap"
+        graph_store, dataset = ingest_id_prop(
+            root_dir,
+            os.path.join(config.output_dir, "dataset_graphs"),
+            file_format=file_format,
+            chunk_size=config.ingest_chunk_size,
+            neighbor_strategy=config.neighbor_strategy,
+            cutoff=config.cutoff,
+            max_neighbors=config.max_neighbors,
+            cachedir=config.cachedir,
+            use_canonize=config.use_canonize,
+            graph_workers=config.graph_workers,
+        )
+    else:
+        with open(id_prop_dat, "r") as f:
+            reader = csv.reader(f)
+            data = [row for row in reader]
+
+        # parsed structures go straight to graph construction; with a
+        # cachedir they are cached by file modification time
+        cache_path = None
+        if config.cachedir is not None:
+            cache_path = os.path.join(
+                config.cachedir, "structures_" + file_format + ".pkl"
             )
-
-        info["atoms"] = atoms.to_dict()
-        info["jid"] = file_name
-
-        tmp = [float(j) for j in i[1:]]  # float(i[1])
-        if len(tmp) == 1:
-            tmp = tmp[0]
-        else:
-            multioutput = True
-        info["target"] = tmp  # float(i[1])
-        n_outputs.append(info["target"])
-        dataset.append(info)
+        structures = read_structures(
+            [os.path.join(root_dir, i[0]) for i in data],
+            file_format=file_format,
+            workers=config.graph_workers,
+            cache_path=cache_path,
+        )
+
+        dataset = []
+        for i, atoms in zip(data, structures):
+            info = {}
+            file_name = i[0]
+            info["atoms"] = atoms
+            info["jid"] = file_name
+
+            tmp = [float(j) for j in i[1:]]  # float(i[1])
+            if len(tmp) == 1:
+                tmp = tmp[0]
+            info["target"] = tmp  # float(i[1])
+            dataset.append(info)
+
+    n_outputs = [i["target"] for i in dataset]
+    multioutput = any(isinstance(i, list) for i in n_outputs)
+    lists_length_equal = True
     if multioutput:
         lists_length_equal = False not in [
             len(i) == len(n_outputs[0]) for i in n_outputs
@@ -175,6 +188,15 @@ def train_for_folder(
         standard_scalar_and_pca=config.standard_scalar_and_pca,
         keep_data_order=config.keep_data_order,
         output_dir=config.output_dir,
+        graph_workers=config.graph_workers,
+        cachedir=config.cachedir,
+        graph_storage=config.graph_storage,
+        graph_lru_size=config.graph_lru_size,
+        max_batch_nodes=config.max_batch_nodes,
+        max_batch_edges=config.max_batch_edges,
+        max_batch_triplets=config.max_batch_triplets,
+        bucket_batching=config.bucket_batching,
+        graph_store=graph_store,
     )
     t1 = time.time()
     train_dgl(
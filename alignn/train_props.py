@@ -37,6 +37,8 @@ def train_prop_model(
     n_early_stopping=None,
     cutoff=None,
     max_neighbors=None,
+    cachedir=None,
+    graph_storage=None,
 ):
     """Train models for a dataset and a property."""
     if scheduler is None:
@@ -72,6 +74,10 @@ def train_prop_model(
         config["cutoff"] = cutoff
     if max_neighbors is not None:
         config["max_neighbors"] = max_neighbors
+    if cachedir is not None:
+        config["cachedir"] = cachedir
+    if graph_storage is not None:
+        config["graph_storage"] = graph_storage
     if weight_decay is not None:
         config["weight_decay"] = weight_decay
     if alignn_layers is not None:
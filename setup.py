@@ -33,7 +33,11 @@ setuptools.setup(
         "pyparsing>=2.2.1,<3",
     ],
     # scripts=["alignn/alignn_train_folder.py"],
-    scripts=["alignn/pretrained.py", "alignn/train_folder.py"],
+    scripts=[
+        "alignn/pretrained.py",
+        "alignn/pretrained_properties.py",
+        "alignn/train_folder.py",
+    ],
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/usnistgov/alignn",